@@ -60,3 +60,81 @@ if django.VERSION < (1, 8):
 else:
     def make_options(options):
         return ()
+
+
+# transaction.atomic was introduced in Django 1.6, older releases only
+# provide commit_on_success which can be used the same way for our needs
+if django.VERSION < (1, 6, 0):  # pragma: no cover
+    from django.db.transaction import commit_on_success as atomic
+else:  # pragma: no cover
+    from django.db.transaction import atomic
+
+
+# setting_changed moved from django.test.signals to django.core.signals
+if django.VERSION < (1, 8, 0):  # pragma: no cover
+    from django.test.signals import setting_changed
+else:  # pragma: no cover
+    from django.core.signals import setting_changed
+
+
+# django.core.cache.caches was introduced in Django 1.7
+if django.VERSION < (1, 7, 0):  # pragma: no cover
+    from django.core.cache import get_cache
+else:  # pragma: no cover
+    from django.core.cache import caches
+
+    def get_cache(alias):
+        return caches[alias]
+
+
+# Templates returned by get_template() take a plain dict since Django 1.8
+if django.VERSION < (1, 8, 0):  # pragma: no cover
+    from django.template import Context
+
+    def render_template(template, context):
+        return template.render(Context(context))
+else:  # pragma: no cover
+    def render_template(template, context):
+        return template.render(context)
+
+
+# importlib is not available in Python 2.6, Django shipped a copy until 1.9
+try:
+    from importlib import import_module
+except ImportError:  # pragma: no cover
+    from django.utils.importlib import import_module
+
+
+# CaptureQueriesContext was introduced in Django 1.6, this is a copy of it
+try:
+    from django.test.utils import CaptureQueriesContext
+except ImportError:  # pragma: no cover
+    class CaptureQueriesContext(object):
+        def __init__(self, connection):
+            self.connection = connection
+
+        def __iter__(self):
+            return iter(self.captured_queries)
+
+        def __getitem__(self, index):
+            return self.captured_queries[index]
+
+        def __len__(self):
+            return len(self.captured_queries)
+
+        @property
+        def captured_queries(self):
+            return self.connection.queries[self.initial_queries:self.final_queries]
+
+        def __enter__(self):
+            self.use_debug_cursor = self.connection.use_debug_cursor
+            self.connection.use_debug_cursor = True
+            self.initial_queries = len(self.connection.queries)
+            self.final_queries = None
+            return self
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            self.connection.use_debug_cursor = self.use_debug_cursor
+            if exc_type is not None:
+                return
+            self.final_queries = len(self.connection.queries)
@@ -38,7 +38,7 @@ class MessageContactManager(models.Manager):
         # If the contact already existed, update the message
         if not created:
             contact.latest_message = message
-            contact.save()
+            contact.save(update_fields=['latest_message'])
         return contact
 
     def get_contacts_for(self, user):
@@ -29,8 +29,14 @@ class MessageCount(template.Node):
             except template.VariableDoesNotExist:
                 return ''
 
-            message_count = MessageRecipient.objects.count_unread_messages_between(user,
-                                                                                   um_to_user)
+            # Counted for a whole page at once by ``MessageListView``.
+            counts = context.get('unread_message_counts') or {}
+            key = (getattr(user, 'pk', None), getattr(um_to_user, 'pk', None))
+            if key in counts:
+                message_count = counts[key]
+            else:
+                message_count = MessageRecipient.objects.count_unread_messages_between(user,
+                                                                                       um_to_user)
 
         context[self.var_name] = message_count
 
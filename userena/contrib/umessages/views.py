@@ -7,6 +7,7 @@ from django.contrib import messages
 from django.utils.translation import ugettext as _
 from django.utils.translation import ungettext
 from django.contrib.auth import REDIRECT_FIELD_NAME
+from django.db.models import Count
 from django.views.generic.list import ListView
 
 from userena.contrib.umessages.models import Message, MessageRecipient, MessageContact
@@ -31,11 +32,38 @@ class MessageListView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super(MessageListView, self).get_context_data(**kwargs)
+        context['unread_message_counts'] = self.get_unread_message_counts(
+            context[self.context_object_name])
         context.update(self.extra_context)
         return context
 
+    def get_unread_message_counts(self, contacts):
+        """
+        Counts the unread messages from every contact on the page with one
+        query, instead of one query per contact in the template.
+
+        :return:
+            Dictionary with ``(user.pk, contact.pk)`` as key, the format
+            ``get_unread_message_count_between`` looks for.
+
+        """
+        user = self.request.user
+        contact_ids = [contact.um_to_user_id
+                       if contact.um_from_user_id == user.pk
+                       else contact.um_from_user_id for contact in contacts]
+        counts = dict(((user.pk, contact_id), 0) for contact_id in contact_ids)
+        if contact_ids:
+            unread = MessageRecipient.objects.filter(
+                user=user, read_at__isnull=True, deleted_at__isnull=True,
+                message__sender__in=contact_ids).order_by() \
+                .values_list('message__sender').annotate(Count('pk'))
+            for sender_id, count in unread:
+                counts[(user.pk, sender_id)] = count
+        return counts
+
     def get_queryset(self):
-        return MessageContact.objects.get_contacts_for(self.request.user)
+        return MessageContact.objects.get_contacts_for(self.request.user) \
+            .select_related('um_from_user', 'um_to_user', 'latest_message')
 
 
 class MessageDetailListView(MessageListView):
@@ -51,6 +79,10 @@ class MessageDetailListView(MessageListView):
         context['recipient'] = self.recipient
         return context
 
+    def get_unread_message_counts(self, messages):
+        """ The messages of a conversation are marked read, none to count. """
+        return {}
+
     def get_queryset(self):
         username = self.kwargs['username']
         self.recipient = get_object_or_404(get_user_model(),
@@ -186,7 +218,7 @@ def message_remove(request, undo=False):
                     message.sender_deleted_at = None
                 else:
                     message.sender_deleted_at = now
-                message.save()
+                message.save(update_fields=['sender_deleted_at'])
                 changed_message_list.add(message.pk)
 
             # Check if the user is a recipient of the message
@@ -197,7 +229,7 @@ def message_remove(request, undo=False):
                     mr.deleted_at = None
                 else:
                     mr.deleted_at = now
-                mr.save()
+                mr.save(update_fields=['deleted_at'])
                 changed_message_list.add(message.pk)
 
         # Send messages
@@ -251,6 +251,6 @@ class EditProfileForm(forms.ModelForm):
         user = profile.user
         user.first_name = self.cleaned_data['first_name']
         user.last_name = self.cleaned_data['last_name']
-        user.save()
+        user.save(update_fields=['first_name', 'last_name'])
 
         return profile
@@ -1,17 +1,33 @@
 # -*- coding: utf-8 -*-
 import re
+import time
 
 from django.conf import settings
-from django.template.loader import render_to_string
-from django.utils.translation import ugettext as _
-from django.core.mail import EmailMultiAlternatives
+from django.template.loader import get_template
+from django.utils.translation import ugettext as _, get_language
+from django.core.mail import EmailMultiAlternatives, get_connection
 
 from userena import settings as userena_settings
+from userena.compat import import_module, render_template, setting_changed
 
 from html2text import html2text
 
-def send_mail(subject, message_plain, message_html, email_from, email_to,
-              custom_headers={}, attachments=()):
+# Compiled templates of ``UserenaConfirmationMail``, kept per process.
+_template_cache = {}
+
+
+def clear_template_cache(setting=None, **kwargs):
+    """ Clears the compiled mail templates when the template settings change. """
+    if setting in (None, 'TEMPLATES', 'TEMPLATE_DIRS', 'TEMPLATE_LOADERS',
+                   'INSTALLED_APPS'):
+        _template_cache.clear()
+
+setting_changed.connect(clear_template_cache,
+                        dispatch_uid='userena_clear_template_cache')
+
+
+def build_mail(subject, message_plain, message_html, email_from, email_to,
+               custom_headers={}, attachments=()):
     """
     Build the email as a multipart message containing
     a multipart alternative for text (plain, HTML) plus
@@ -37,7 +53,75 @@ def send_mail(subject, message_plain, message_html, email_from, email_to,
     msg = EmailMultiAlternatives(**message)
     if message_html:
         msg.attach_alternative(message_html, "text/html")
-    msg.send()
+    return msg
+
+
+def send_mail(subject, message_plain, message_html, email_from, email_to,
+              custom_headers={}, attachments=()):
+    """
+    Build the email with :func:`build_mail` and hand it to the delivery
+    defined by ``USERENA_MAIL_DELIVERY``.
+    """
+    msg = build_mail(subject, message_plain, message_html, email_from,
+                     email_to, custom_headers, attachments)
+    get_mail_delivery().deliver([msg])
+
+
+def send_mass_mail(messages):
+    """
+    Hands a list of messages, as returned by :func:`build_mail`, to the
+    delivery defined by ``USERENA_MAIL_DELIVERY`` at once.
+
+    :param messages:
+        List of ``EmailMessage`` instances.
+
+    :return: Tuple of the amount of delivered messages and the seconds it took.
+    """
+    started = time.time()
+    delivered = get_mail_delivery().deliver(messages) if messages else 0
+    return delivered, time.time() - started
+
+
+class ImmediateDelivery(object):
+    """
+    Sends the messages right away over a single connection, this is the
+    default delivery.
+    """
+
+    def deliver(self, messages):
+        connection = get_connection()
+        return connection.send_messages(list(messages)) or 0
+
+
+class OutboxDelivery(object):
+    """
+    Stores the messages in the :class:`UserenaOutboxMessage` table. They are
+    send by the ``userena_send_mail`` command, so the request never waits on
+    the mail server.
+
+    Messages with attachments can't be stored and are sent right away.
+    """
+
+    def deliver(self, messages):
+        from userena.models import UserenaOutboxMessage
+
+        outbox = []
+        for msg in messages:
+            if msg.attachments:
+                msg.send()
+            else:
+                outbox.append(UserenaOutboxMessage.from_message(msg))
+        UserenaOutboxMessage.objects.bulk_create(outbox)
+        return len(messages)
+
+
+def get_mail_delivery():
+    """
+    Returns an instance of the delivery class defined by the
+    ``USERENA_MAIL_DELIVERY`` setting.
+    """
+    module_name, class_name = userena_settings.USERENA_MAIL_DELIVERY.rsplit('.', 1)
+    return getattr(import_module(module_name), class_name)()
 
 
 def wrap_attachment():
@@ -58,28 +142,78 @@ class UserenaConfirmationMail(object):
         self.message_txt = self._message_txt.format(type_mail, version)
         self.message_html = self._message_html.format(type_mail, version)
         self.subject_txt = self._subject_txt.format(type_mail, version)
-        self.subject = self._subject()
-        self.message_html = self._message_in_html()
-        self.message = self._message_in_txt()
+        self.subject, self.message, self.message_html = self._render(
+            self.get_templates(type_mail, version), self.context)
+
+    def build_message(self, email):
+        """ Returns the generated mail as message for ``email``. """
+        return build_mail(self.subject, self.message,
+                          self.message_html, settings.DEFAULT_FROM_EMAIL,
+                          [email])
 
     def send_mail(self, email):
-        send_mail(self.subject, self.message,
-                  self.message_html, settings.DEFAULT_FROM_EMAIL,
-                  [email])
-
-    def _message_in_html(self):
-        if userena_settings.USERENA_HTML_EMAIL:
-            return render_to_string(self.message_html, self.context)
-        return None
-
-    def _message_in_txt(self):
-        if (not userena_settings.USERENA_HTML_EMAIL
-            or not self.message_html
-            or userena_settings.USERENA_USE_PLAIN_TEMPLATE):
-            return render_to_string(self.message_txt, self.context)
-        return None
-
-    def _subject(self):
-        subject = render_to_string(self.subject_txt, self.context)
-        subject = ''.join(subject.splitlines())
-        return subject
+        send_mass_mail([self.build_message(email)])
+
+    def build_messages(self, type_mail, recipients, version=""):
+        """
+        Renders a mail for many recipients with the same compiled templates.
+
+        :param type_mail:
+            String with the type of the mail, f.ex. ``activation``.
+
+        :param recipients:
+            Iterable of ``(context, email)`` tuples. Every context is added
+            to the context this mail was created with.
+
+        :param version:
+            Optional string appended to the template names.
+
+        :return: List of messages for :func:`send_mass_mail`.
+
+        """
+        templates = self.get_templates(type_mail, version)
+        messages = []
+        for context, email in recipients:
+            full_context = dict(self.context or {})
+            full_context.update(context)
+            subject, message, message_html = self._render(templates,
+                                                          full_context)
+            messages.append(build_mail(subject, message, message_html,
+                                       settings.DEFAULT_FROM_EMAIL, [email]))
+        return messages
+
+    def get_templates(self, type_mail, version=""):
+        """
+        Returns the compiled subject, plain text and HTML templates. Templates
+        that are not used with the current settings are ``None``.
+
+        The templates are compiled once per type, version and language.
+
+        """
+        use_html = userena_settings.USERENA_HTML_EMAIL
+        use_plain = (not use_html or userena_settings.USERENA_USE_PLAIN_TEMPLATE)
+        key = (type_mail, version, get_language(), use_html, use_plain)
+        try:
+            return _template_cache[key]
+        except KeyError:
+            pass
+
+        templates = (
+            get_template(self._subject_txt.format(type_mail, version)),
+            get_template(self._message_txt.format(type_mail, version)) if use_plain else None,
+            get_template(self._message_html.format(type_mail, version)) if use_html else None,
+        )
+        _template_cache[key] = templates
+        return templates
+
+    def _render(self, templates, context):
+        """ Returns the subject, plain text and HTML message. """
+        subject_template, txt_template, html_template = templates
+        subject = ''.join(render_template(subject_template, context).splitlines())
+        message_html = None
+        if html_template is not None:
+            message_html = render_template(html_template, context)
+        message = None
+        if txt_template is not None:
+            message = render_template(txt_template, context)
+        return subject, message, message_html
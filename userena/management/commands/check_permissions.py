@@ -1,10 +1,43 @@
-from django.core.management.base import BaseCommand
+from multiprocessing import Pool
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
 from django.utils.encoding import smart_text
 
 from userena.compat import make_options
 from userena.models import UserenaSignup
+from userena.utils import setup_worker
 
 arguments = (
+    ('--dry-run', {
+        'action': 'store_true',
+        'dest': 'dry_run',
+        'default': False,
+        'help': 'Only report the missing permissions, do not repair them.'
+    }),
+    ('--chunk-size', {
+        'action': 'store',
+        'type': int,
+        'dest': 'chunk_size',
+        'default': 1000,
+        'help': 'Amount of users checked at once.'
+    }),
+    ('--workers', {
+        'action': 'store',
+        'type': int,
+        'dest': 'workers',
+        'default': 1,
+        'help': 'Amount of processes checking a part of the users.'
+    }),
+    ('--shard', {
+        'action': 'store',
+        'dest': 'shard',
+        'default': None,
+        'help': "Only check a part of the users, e.g. '2/4' for the second of four parts."
+    }),
     ('--no-output', {
         'action': 'store_false',
         'dest': 'output',
@@ -20,6 +53,20 @@ arguments = (
 )
 
 
+def split_range(min_id, max_id, parts):
+    """ Splits the ids from ``min_id`` to ``max_id`` in ``parts`` ranges. """
+    size = (max_id - min_id) // parts + 1
+    return [(min_id + i * size, min(min_id + (i + 1) * size - 1, max_id))
+            for i in range(parts) if min_id + i * size <= max_id]
+
+
+def check_range(args):
+    """ Checks the permissions of the users in a range of ids. """
+    dry_run, chunk_size, min_id, max_id = args
+    return UserenaSignup.objects.check_user_permissions(
+        dry_run=dry_run, chunk_size=chunk_size, min_id=min_id, max_id=max_id)
+
+
 class Command(BaseCommand):
     """
     For unknown reason, users can get wrong permissions.
@@ -35,21 +82,81 @@ class Command(BaseCommand):
 
     help = 'Check that user permissions are correct.'
     def handle(self, **options):
-        permissions, users, warnings  = UserenaSignup.objects.check_permissions()
+        dry_run = options.pop("dry_run")
+        permissions, users, warnings = self.check_permissions(
+            dry_run, options.pop("chunk_size"), options.pop("workers"),
+            options.pop("shard"))
         output = options.pop("output")
         test = options.pop("test")
         if test:
             self.stdout.write(40 * ".")
             self.stdout.write("\nChecking permission management command. Ignore output..\n\n")
         if output:
+            verb = "Missing" if dry_run else "Added"
             for p in permissions:
-                self.stdout.write("Added permission: %s\n" % p)
+                self.stdout.write("%s permission: %s\n" % (verb, p))
 
-            for u in users:
-                self.stdout.write("Changed permissions for user: %s\n" % smart_text(u, encoding='utf-8', strings_only=False))
+            for username, codenames in users:
+                self.stdout.write("%s permissions for user: %s (%s)\n" % (
+                    verb, smart_text(username, encoding='utf-8', strings_only=False),
+                    ", ".join(codenames)))
 
             for w in warnings:
                 self.stdout.write("WARNING: %s\n" %w)
 
+            self.stdout.write("%s %d permissions, %d object permissions for %d users.\n" % (
+                verb, len(permissions),
+                sum(len(codenames) for username, codenames in users),
+                len(users)))
+
         if test:
             self.stdout.write("\nFinished testing permissions command.. continuing..\n")
+
+    def check_permissions(self, dry_run, chunk_size, workers, shard):
+        """
+        Checks the permissions of the ids in ``shard``, divided over
+        ``workers`` processes which each use their own database connection.
+
+        """
+        if workers < 1:
+            raise CommandError("--workers should be at least 1.")
+        if shard:
+            try:
+                index, count = [int(part) for part in shard.split('/')]
+            except ValueError:
+                raise CommandError("--shard should look like 'i/N'.")
+            if not 1 <= index <= count:
+                raise CommandError("--shard should be between 1/N and N/N.")
+        else: index, count = 1, 1
+
+        permissions = UserenaSignup.objects.check_model_permissions(dry_run)
+
+        ids = get_user_model().objects.exclude(
+            id=settings.ANONYMOUS_USER_ID).aggregate(Min('pk'), Max('pk'))
+        if ids['pk__min'] is None:
+            return permissions, [], []
+        shards = split_range(ids['pk__min'], ids['pk__max'], count)
+        if index > len(shards):
+            return permissions, [], []
+        min_id, max_id = shards[index - 1]
+
+        ranges = [(dry_run, chunk_size, low, high)
+                  for low, high in split_range(min_id, max_id, workers)]
+        if workers == 1:
+            results = [check_range(ranges[0])]
+        else:
+            # Every process should open its own database connection.
+            for connection in connections.all():
+                connection.close()
+            pool = Pool(workers, initializer=setup_worker)
+            try:
+                results = pool.map(check_range, ranges)
+            finally:
+                pool.close()
+                pool.join()
+
+        users, warnings = [], []
+        for range_users, range_warnings in results:
+            users.extend(range_users)
+            warnings.extend(range_warnings)
+        return permissions, users, warnings
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from userena.compat import make_options
+from userena.models import UserenaVisibilityMixin
+from userena.utils import get_profile_model
+
+arguments = (
+    ('--dry-run', {
+        'action': 'store_true',
+        'dest': 'dry_run',
+        'default': False,
+        'help': 'Only count the profiles with a wrong visibility, do not repair them.'
+    }),
+    ('--no-output', {
+        'action': 'store_false',
+        'dest': 'output',
+        'default': True,
+        'help': 'Hide informational output.'
+    }),
+)
+
+
+class Command(BaseCommand):
+    """
+    Checks that the denormalized ``visibility`` of every profile matches its
+    ``privacy`` and the active state of its user, and repairs the profiles
+    that don't. Run it after enabling ``USERENA_DENORMALIZED_VISIBILITY`` to
+    fill in the existing profiles.
+
+    """
+    option_list = make_options(arguments)
+
+    def add_arguments(self, parser):
+            for arg, attrs in arguments:
+                parser.add_argument(arg, **attrs)
+
+    help = 'Check that the visibility of profiles is correct.'
+    def handle(self, *args, **options):
+        profile_model = get_profile_model()
+        if not issubclass(profile_model, UserenaVisibilityMixin):
+            raise CommandError("The profile model has no visibility field, "
+                               "add the UserenaVisibilityMixin to it.")
+        profiles = profile_model.objects
+        if options['dry_run']:
+            count = profiles.inconsistent_visibility().count()
+            verb = 'Found'
+        else:
+            count = profiles.update_visibility()
+            verb = 'Repaired'
+
+        if options['output']:
+            self.stdout.write("%s %d profiles with a wrong visibility.\n"
+                              % (verb, count))
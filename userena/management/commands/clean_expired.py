@@ -1,13 +1,88 @@
+import time
+
 from django.core.management.base import BaseCommand
 
+from userena.compat import make_options
 from userena.models import UserenaSignup
 
+arguments = (
+    ('--batch-size', {
+        'action': 'store',
+        'type': int,
+        'dest': 'batch_size',
+        'default': 1000,
+        'help': 'Amount of users deleted in one transaction.'
+    }),
+    ('--max-rows-per-second', {
+        'action': 'store',
+        'type': float,
+        'dest': 'max_rate',
+        'default': None,
+        'help': 'Sleep between batches so no more users are deleted per second.'
+    }),
+    ('--dry-run', {
+        'action': 'store_true',
+        'dest': 'dry_run',
+        'default': False,
+        'help': 'Only count the expired users, do not delete them.'
+    }),
+    ('--since-id', {
+        'action': 'store',
+        'type': int,
+        'dest': 'since_id',
+        'default': None,
+        'help': 'Only handle users with a higher id, used to resume a run.'
+    }),
+    ('--no-output', {
+        'action': 'store_false',
+        'dest': 'output',
+        'default': True,
+        'help': 'Hide informational output.'
+    }),
+)
+
+
 class Command(BaseCommand):
     """
     Search for users that still haven't verified their email after
     ``USERENA_ACTIVATION_DAYS`` and delete them.
 
+    Users are deleted in batches, after each batch a progress line is written
+    containing the last deleted id which can be supplied to ``--since-id`` to
+    resume an interrupted run.
+
     """
+    option_list = make_options(arguments)
+
+    def add_arguments(self, parser):
+            for arg, attrs in arguments:
+                parser.add_argument(arg, **attrs)
+
     help = 'Deletes expired users.'
-    def handle(self, *args, **kwargs):
-        users = UserenaSignup.objects.delete_expired_users()
+    def handle(self, *args, **options):
+        output = options['output']
+        max_rate = options['max_rate']
+        verb = 'Found' if options['dry_run'] else 'Deleted'
+
+        total = 0
+        started = time.time()
+        batches = UserenaSignup.objects.delete_expired_users_in_batches(
+            batch_size=options['batch_size'],
+            since_id=options['since_id'],
+            dry_run=options['dry_run'])
+
+        for last_id, count in batches:
+            total += count
+            elapsed = time.time() - started
+
+            # Throttle so we don't flood the database (and its replicas).
+            if max_rate and total / max_rate > elapsed:
+                time.sleep(total / max_rate - elapsed)
+                elapsed = time.time() - started
+
+            if output:
+                self.stdout.write("%s %d expired users (%.1f rows/s), last id: %s\n"
+                                  % (verb, total, total / max(elapsed, 0.001), last_id))
+
+        if output:
+            self.stdout.write("%s %d expired users in total.\n" % (verb, total))
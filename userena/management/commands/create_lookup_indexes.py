@@ -0,0 +1,101 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from userena.compat import make_options
+
+arguments = (
+    ('--database', {
+        'action': 'store',
+        'dest': 'database',
+        'default': DEFAULT_DB_ALIAS,
+        'help': 'Database to create the indexes in.'
+    }),
+    ('--concurrently', {
+        'action': 'store_true',
+        'dest': 'concurrently',
+        'default': False,
+        'help': 'Build the indexes without locking the table for writes.'
+    }),
+    ('--drop', {
+        'action': 'store_true',
+        'dest': 'drop',
+        'default': False,
+        'help': 'Drop the indexes instead of creating them.'
+    }),
+    ('--sql', {
+        'action': 'store_true',
+        'dest': 'sql',
+        'default': False,
+        'help': 'Only print the SQL statements.'
+    }),
+)
+
+# Fields of the user model that are looked up with ``__iexact`` by userena.
+LOOKUP_FIELDS = ('username', 'email')
+
+
+def lookup_indexes(connection, model=None):
+    """
+    Returns a list of tuples with the name of the index and the expression
+    used by ``__iexact`` lookups on ``LOOKUP_FIELDS`` of the user model.
+
+    PostgreSQL compiles ``field__iexact=value`` to
+    ``UPPER("field"::text) = UPPER(value)``, an index on exactly that
+    expression lets the existing lookups use an index scan.
+
+    """
+    model = model or get_user_model()
+    table = model._meta.db_table
+    indexes = []
+    for name in LOOKUP_FIELDS:
+        column = model._meta.get_field(name).column
+        indexes.append(('userena_%s_upper_%s' % (table, column),
+                        '%s (UPPER(%s::text))' % (
+                            connection.ops.quote_name(table),
+                            connection.ops.quote_name(column))))
+    return indexes
+
+
+class Command(BaseCommand):
+    """
+    Creates expression indexes on the user table that serve the case
+    insensitive lookups of usernames and email addresses done at sign in,
+    sign up and in the views.
+
+    """
+    option_list = make_options(arguments)
+
+    def add_arguments(self, parser):
+            for arg, attrs in arguments:
+                parser.add_argument(arg, **attrs)
+
+    help = 'Creates indexes for case insensitive username and email lookups.'
+    def handle(self, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            self.stdout.write("Nothing to do for %s, only PostgreSQL needs "
+                              "expression indexes for case insensitive "
+                              "lookups.\n" % connection.vendor)
+            return
+
+        concurrently = ' CONCURRENTLY' if options['concurrently'] else ''
+        cursor = connection.cursor()
+        for name, expression in lookup_indexes(connection):
+            cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s",
+                           [name])
+            exists = cursor.fetchone() is not None
+            if options['drop']:
+                if not exists:
+                    continue
+                sql = 'DROP INDEX%s %s' % (concurrently,
+                                           connection.ops.quote_name(name))
+            else:
+                if exists:
+                    continue
+                sql = 'CREATE INDEX%s %s ON %s' % (
+                    concurrently, connection.ops.quote_name(name), expression)
+
+            self.stdout.write(sql + ';\n')
+            if not options['sql']:
+                cursor.execute(sql)
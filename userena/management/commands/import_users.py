@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import six
+from django.utils.encoding import smart_text
+
+from userena.compat import make_options
+from userena.managers import BulkCreateError
+from userena.models import UserenaSignup
+
+arguments = (
+    ('--format', {
+        'action': 'store',
+        'dest': 'format',
+        'default': None,
+        'help': "Format of the file, 'csv' or 'jsonl'. Guessed from the extension by default."
+    }),
+    ('--chunk-size', {
+        'action': 'store',
+        'type': int,
+        'dest': 'chunk_size',
+        'default': 500,
+        'help': 'Amount of users created in one transaction.'
+    }),
+    ('--skip-rows', {
+        'action': 'store',
+        'type': int,
+        'dest': 'skip_rows',
+        'default': 0,
+        'help': 'Skip the first rows of the file, used to resume an import.'
+    }),
+    ('--active', {
+        'action': 'store_true',
+        'dest': 'active',
+        'default': False,
+        'help': "Create active users that don't require activation."
+    }),
+    ('--no-email', {
+        'action': 'store_false',
+        'dest': 'send_email',
+        'default': True,
+        'help': "Don't send activation emails."
+    }),
+)
+
+
+def read_csv(stream):
+    """ Yields a dictionary per row of a CSV file with a header line. """
+    for row in csv.DictReader(stream):
+        yield dict((key, smart_text(value)) for key, value in row.items())
+
+
+def read_jsonl(stream):
+    """ Yields a dictionary per line of a file containing JSON objects. """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+READERS = {'csv': read_csv,
+           'jsonl': read_jsonl}
+
+
+class Command(BaseCommand):
+    """
+    Import users from a CSV or JSON lines file.
+
+    Every row needs a ``username``, ``email`` and ``password``. The file is
+    read as a stream and the users are created in chunks, after each chunk a
+    progress line is written containing the amount of rows read which can be
+    supplied to ``--skip-rows`` to resume an interrupted import.
+
+    """
+    option_list = make_options(arguments)
+    args = '<file>'
+
+    def add_arguments(self, parser):
+            for arg, attrs in arguments:
+                parser.add_argument(arg, **attrs)
+
+    help = 'Creates users from a CSV or JSON lines file.'
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Supply the file to import.')
+        path = args[0]
+
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in READERS:
+            raise CommandError("Unknown format '%s', use one of: %s."
+                               % (file_format, ', '.join(sorted(READERS))))
+
+        # The csv module of Python 2 only reads byte strings.
+        if six.PY2:
+            stream = open(path, 'rb')
+        else: stream = io.open(path, encoding='utf-8', newline='')
+
+        skip_rows = options['skip_rows']
+        created = 0
+        with stream:
+            rows = islice(READERS[file_format](stream), skip_rows, None)
+            chunks = UserenaSignup.objects.bulk_create_users_in_chunks(
+                rows,
+                active=options['active'],
+                send_email=options['send_email'],
+                chunk_size=options['chunk_size'])
+            try:
+                for read, signups, skipped in chunks:
+                    created += len(signups)
+                    if skipped:
+                        self.stdout.write("Skipped existing usernames: %s\n"
+                                          % ', '.join(skipped))
+                    self.stdout.write("Imported %d users, rows read: %d\n"
+                                      % (created, skip_rows + read))
+            except BulkCreateError as e:
+                raise CommandError("Importing the rows from %d on failed: %s\n"
+                                   "Imported %d users, rerun with "
+                                   "--skip-rows %d to resume."
+                                   % (skip_rows + e.rows + 1, e.error,
+                                      e.created, skip_rows + e.rows))
+
+        self.stdout.write("Imported %d users.\n" % created)
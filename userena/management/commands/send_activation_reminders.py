@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+
+from userena import settings as userena_settings
+from userena.compat import make_options
+from userena.models import UserenaSignup
+
+arguments = (
+    ('--batch-size', {
+        'action': 'store',
+        'type': int,
+        'dest': 'batch_size',
+        'default': 500,
+        'help': 'Amount of reminders send over one connection.'
+    }),
+    ('--dry-run', {
+        'action': 'store_true',
+        'dest': 'dry_run',
+        'default': False,
+        'help': 'Only count the reminders, do not send them.'
+    }),
+    ('--no-output', {
+        'action': 'store_false',
+        'dest': 'output',
+        'default': True,
+        'help': 'Hide informational output.'
+    }),
+)
+
+
+class Command(BaseCommand):
+    """
+    Reminds users that haven't activated their account that it will expire
+    within ``USERENA_ACTIVATION_NOTIFY_DAYS``. Every user gets one reminder.
+
+    """
+    option_list = make_options(arguments)
+
+    def add_arguments(self, parser):
+            for arg, attrs in arguments:
+                parser.add_argument(arg, **attrs)
+
+    help = 'Sends reminders to users that have not activated their account.'
+    def handle(self, *args, **options):
+        output = options['output']
+        verb = 'Found' if options['dry_run'] else 'Sent'
+
+        if not userena_settings.USERENA_ACTIVATION_NOTIFY:
+            if output:
+                self.stdout.write("Activation reminders are disabled by USERENA_ACTIVATION_NOTIFY.\n")
+            return
+
+        total = 0
+        batches = UserenaSignup.objects.send_activation_reminders(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'])
+
+        for count, seconds in batches:
+            total += count
+            if output and not options['dry_run']:
+                self.stdout.write("Sent %d reminders in %.2f seconds.\n"
+                                  % (count, seconds))
+
+        if output:
+            self.stdout.write("%s %d reminders in total.\n" % (verb, total))
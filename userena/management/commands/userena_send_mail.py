@@ -0,0 +1,83 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from userena.compat import make_options
+from userena.models import UserenaOutboxMessage
+
+arguments = (
+    ('--batch-size', {
+        'action': 'store',
+        'type': int,
+        'dest': 'batch_size',
+        'default': 100,
+        'help': 'Amount of messages send over one connection.'
+    }),
+    ('--max-attempts', {
+        'action': 'store',
+        'type': int,
+        'dest': 'max_attempts',
+        'default': 5,
+        'help': 'Give up on a message after this many failed attempts.'
+    }),
+    ('--backoff', {
+        'action': 'store',
+        'type': int,
+        'dest': 'backoff',
+        'default': 60,
+        'help': 'Seconds before the first retry, doubled on every attempt.'
+    }),
+    ('--loop', {
+        'action': 'store_true',
+        'dest': 'loop',
+        'default': False,
+        'help': 'Keep running and poll the outbox for new messages.'
+    }),
+    ('--interval', {
+        'action': 'store',
+        'type': float,
+        'dest': 'interval',
+        'default': 5,
+        'help': 'Seconds to wait when the outbox is empty, used with --loop.'
+    }),
+    ('--no-output', {
+        'action': 'store_false',
+        'dest': 'output',
+        'default': True,
+        'help': 'Hide informational output.'
+    }),
+)
+
+
+class Command(BaseCommand):
+    """
+    Sends the emails stored in the outbox by
+    ``userena.mail.OutboxDelivery``.
+
+    Without ``--loop`` the outbox is emptied once, which makes it suitable for
+    cron. Failed messages are retried with an exponential backoff.
+
+    """
+    option_list = make_options(arguments)
+
+    def add_arguments(self, parser):
+            for arg, attrs in arguments:
+                parser.add_argument(arg, **attrs)
+
+    help = 'Sends the emails in the userena outbox.'
+    def handle(self, *args, **options):
+        output = options['output']
+
+        while True:
+            sent, failed = UserenaOutboxMessage.objects.send_pending(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'],
+                backoff=options['backoff'])
+
+            if output and (sent or failed):
+                self.stdout.write("Sent %d messages, %d failed.\n" % (sent, failed))
+
+            if sent + failed < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
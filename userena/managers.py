@@ -1,23 +1,30 @@
-from django.db import models
+from django.db import IntegrityError, models
 from django.db.models import Q
-from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import UserManager, Permission, AnonymousUser
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
 from django.utils.encoding import smart_text
 from django.utils.translation import ugettext as _
 from django.conf import settings
 from django.utils.six import text_type
 
 from userena import settings as userena_settings
-from userena.utils import generate_sha1, get_profile_model, get_datetime_now, \
-    get_user_profile
+from userena.compat import atomic
+from userena.mail import UserenaConfirmationMail, send_mass_mail
+from userena.utils import generate_key, get_profile_model, get_datetime_now, \
+    get_user_profile, get_protocol, check_signed_token
 from userena import signals as userena_signals
 
-from guardian.shortcuts import assign_perm, get_perms
+from guardian.models import UserObjectPermission, GroupObjectPermission
 
 
 
+from functools import reduce
+from itertools import islice
+import datetime
+import operator
 import re
 
 SHA1_RE = re.compile('^[a-f0-9]{40}$')
@@ -32,6 +39,85 @@ ASSIGNED_PERMISSIONS = {
          ('delete_user', 'Can delete user'))
 }
 
+
+class BulkCreateError(IntegrityError):
+    """
+    Raised by :meth:`UserenaManager.bulk_create_users` when a chunk can't be
+    inserted.
+
+    ``rows`` is the amount of rows that were committed before the failing
+    chunk, skip them to resume. ``created`` is the amount of users created
+    from those rows.
+
+    """
+    def __init__(self, error, rows, created):
+        super(BulkCreateError, self).__init__(
+            "Creating the users from row %d on failed, %d users were "
+            "created before: %s" % (rows + 1, created, error))
+        self.error = error
+        self.rows = rows
+        self.created = created
+
+
+# Permission instances of ``ASSIGNED_PERMISSIONS`` per model, resolved once
+# per process because they are needed for every new user.
+_assigned_permissions_cache = {}
+
+
+def get_assigned_permissions(model, strict=True):
+    """
+    Returns the ``Permission`` instances which are assigned to new users for
+    ``model``.
+
+    :param model:
+        Either ``'profile'`` or ``'user'``, the keys of
+        ``ASSIGNED_PERMISSIONS``.
+
+    :param strict:
+        Boolean that defines if ``Permission.DoesNotExist`` is raised when
+        some of the permissions don't exist. Otherwise only the existing
+        permissions are returned. Defaults to ``True``.
+
+    :return:
+        A tuple containing the ``ContentType`` of the model and a list of
+        ``Permission`` instances.
+
+    """
+    if model == 'profile':
+        model_obj = get_profile_model()
+    else: model_obj = get_user_model()
+
+    try:
+        return _assigned_permissions_cache[model_obj]
+    except KeyError:
+        pass
+
+    content_type = ContentType.objects.get_for_model(model_obj)
+    codenames = [perm[0] for perm in ASSIGNED_PERMISSIONS[model]]
+    permissions = list(Permission.objects.filter(content_type=content_type,
+                                                 codename__in=codenames))
+    # Don't cache an incomplete set, ``check_permissions`` may create them.
+    if len(permissions) != len(codenames):
+        if strict:
+            missing = set(codenames) - set(p.codename for p in permissions)
+            raise Permission.DoesNotExist(
+                "Permission matching query does not exist: %s"
+                % ", ".join(sorted(missing)))
+        return content_type, permissions
+    _assigned_permissions_cache[model_obj] = (content_type, permissions)
+    return content_type, permissions
+
+
+def clear_assigned_permissions_cache(**kwargs):
+    """ Clears the cache of :func:`get_assigned_permissions`. """
+    _assigned_permissions_cache.clear()
+
+post_save.connect(clear_assigned_permissions_cache, sender=Permission,
+                  dispatch_uid='userena_clear_assigned_permissions_cache')
+post_delete.connect(clear_assigned_permissions_cache, sender=Permission,
+                    dispatch_uid='userena_clear_assigned_permissions_cache')
+
+
 class UserenaManager(UserManager):
     """ Extra functionality for the Userena model. """
 
@@ -64,16 +150,12 @@ class UserenaManager(UserManager):
 
         new_user = get_user_model().objects.create_user(
             username, email, password)
-        new_user.is_active = active
-        new_user.save()
+        if not active:
+            new_user.is_active = False
+            new_user.save(update_fields=['is_active'])
 
-        # Give permissions to view and change profile
-        for perm in ASSIGNED_PERMISSIONS['profile']:
-            assign_perm(perm[0], new_user, get_user_profile(user=new_user))
-
-        # Give permissions to view and change itself
-        for perm in ASSIGNED_PERMISSIONS['user']:
-            assign_perm(perm[0], new_user, new_user)
+        # Give permissions to view and change profile and itself
+        self.assign_permissions(new_user, get_user_profile(user=new_user))
 
         userena_profile = self.create_userena_profile(new_user)
 
@@ -82,6 +164,164 @@ class UserenaManager(UserManager):
 
         return new_user
 
+    def bulk_create_users(self, users, active=False, send_email=True,
+                          chunk_size=500):
+        """
+        Creates many users at once, the batch equivalent of
+        :meth:`create_user`.
+
+        Users, profiles, permissions and :class:`UserenaSignup` instances are
+        inserted with ``bulk_create`` per chunk, each chunk inside its own
+        transaction. Because of this no ``post_save`` signals are send for
+        the created instances. Usernames that already exist, or that occur
+        twice, are skipped.
+
+        :param users:
+            Iterable of dictionaries containing the ``username``, ``email``
+            and ``password`` of every user. The iterable is consumed lazily,
+            so it can be a generator reading from a file.
+
+        :param active:
+            Boolean that defines if the users require activation. Defaults to
+            ``False``.
+
+        :param send_email:
+            Boolean that defines if the users should be sent an activation
+            email. Emails are sent after the chunk is committed.
+
+        :param chunk_size:
+            Integer defining the amount of users created in one transaction.
+            Defaults to ``500``.
+
+        :return: The amount of created users.
+
+        """
+        created = 0
+        for rows, signups, skipped in self.bulk_create_users_in_chunks(
+                users, active, send_email, chunk_size):
+            created += len(signups)
+        return created
+
+    def bulk_create_users_in_chunks(self, users, active=False,
+                                    send_email=True, chunk_size=500):
+        """
+        Does the work of :meth:`bulk_create_users`, one chunk at a time.
+
+        When a chunk fails, for example on a unique email address, its
+        transaction is rolled back and a :class:`BulkCreateError` is raised
+        telling how many rows were committed before.
+
+        :return:
+            Generator yielding a tuple with the amount of rows read, the
+            created :class:`UserenaSignup` instances and the skipped
+            usernames for every committed chunk.
+
+        """
+        users = iter(users)
+        rows = 0
+        created = 0
+        while True:
+            chunk = list(islice(users, chunk_size))
+            if not chunk:
+                return
+            try:
+                with atomic(using=self._db):
+                    signups, skipped = self._bulk_create_chunk(chunk, active)
+            except IntegrityError as e:
+                raise BulkCreateError(e, rows, created)
+            rows += len(chunk)
+            created += len(signups)
+            if send_email:
+                send_mass_mail([signup.build_activation_email()
+                                for signup in signups])
+            yield rows, signups, skipped
+
+    def _bulk_create_chunk(self, chunk, active):
+        """
+        Creates one chunk of users for :meth:`bulk_create_users`.
+
+        :return:
+            Tuple with the created :class:`UserenaSignup` instances and the
+            usernames that were skipped.
+
+        """
+        User = get_user_model()
+        profile_model = get_profile_model()
+        now = get_datetime_now()
+
+        usernames = [smart_text(data['username']) for data in chunk]
+        seen = set(User.objects.filter(username__in=usernames)
+                   .values_list('username', flat=True))
+        skipped = []
+        new_users = []
+        for username, data in zip(usernames, chunk):
+            if username in seen:
+                skipped.append(username)
+                continue
+            seen.add(username)
+            user = User(username=username,
+                        email=UserManager.normalize_email(data['email']),
+                        is_active=active,
+                        date_joined=now)
+            user.set_password(data['password'])
+            new_users.append(user)
+        if not new_users:
+            return [], skipped
+        User.objects.bulk_create(new_users)
+
+        # ``bulk_create`` doesn't set the primary keys on all backends.
+        new_users = list(User.objects.filter(
+            username__in=[user.username for user in new_users]))
+        new_profiles = [profile_model(user=user) for user in new_users]
+        # ``bulk_create`` doesn't send the ``pre_save`` signal which derives
+        # the visibility.
+        if uses_visibility(profile_model):
+            for profile in new_profiles:
+                profile.visibility = profile.get_visibility()
+        profile_model.objects.bulk_create(new_profiles)
+        profiles = dict((profile.user_id, profile) for profile in
+                        profile_model.objects.filter(user__in=new_users))
+
+        object_permissions = []
+        for user in new_users:
+            object_permissions.extend(
+                self._object_permissions(user, profiles[user.pk]))
+        UserObjectPermission.objects.bulk_create(object_permissions)
+
+        signups = [self.model(user=user,
+                              activation_key=generate_key())
+                   for user in new_users]
+        self.bulk_create(signups)
+        return signups, skipped
+
+    def assign_permissions(self, user, profile):
+        """
+        Gives a new user the ``ASSIGNED_PERMISSIONS`` on their profile and on
+        the user itself, written in a single query.
+
+        :param user:
+            Django :class:`User` instance that receives the permissions.
+
+        :param profile:
+            The profile instance of ``user``.
+
+        """
+        UserObjectPermission.objects.bulk_create(
+            self._object_permissions(user, profile))
+
+    def _object_permissions(self, user, profile):
+        """ Unsaved ``UserObjectPermission`` instances for a new user. """
+        object_permissions = []
+        for model, obj in (('profile', profile), ('user', user)):
+            content_type, permissions = get_assigned_permissions(model)
+            for permission in permissions:
+                object_permissions.append(
+                    UserObjectPermission(user=user,
+                                         permission=permission,
+                                         content_type=content_type,
+                                         object_pk=obj.pk))
+        return object_permissions
+
     def create_userena_profile(self, user):
         """
         Creates an :class:`UserenaSignup` instance for this user.
@@ -94,7 +334,7 @@ class UserenaManager(UserManager):
         """
         if isinstance(user.username, text_type):
             user.username = smart_text(user.username)
-        salt, activation_key = generate_sha1(user.username)
+        activation_key = generate_key()
 
         try:
             profile = self.get(user=user)
@@ -113,20 +353,56 @@ class UserenaManager(UserManager):
 
         """
         try:
-            userena = self.get(activation_key=activation_key)
+            userena = self.get_by_activation_key(activation_key)
         except self.model.DoesNotExist:
             return False
         try:
-            salt, new_activation_key = generate_sha1(userena.user.username)
-            userena.activation_key = new_activation_key
-            userena.save(using=self._db)
+            userena.activation_key = generate_key()
+            userena.save(using=self._db, update_fields=['activation_key'])
             userena.user.date_joined = get_datetime_now()
-            userena.user.save(using=self._db)
+            userena.user.save(using=self._db, update_fields=['date_joined'])
             userena.send_activation_email()
             return True
         except Exception:
             return False
 
+    def get_by_activation_key(self, activation_key, check_age=False):
+        """
+        Returns the :class:`UserenaSignup` of an ``activation_key``.
+
+        When ``USERENA_SIGNED_TOKENS`` is ``True`` the key is a signed token
+        which is verified before the signup is fetched by its user. Stored
+        SHA1 keys, from mails sent before the setting was enabled, are still
+        looked up.
+
+        :param activation_key:
+            String containing the secret SHA1 or the signed token.
+
+        :param check_age:
+            Boolean that defines if signed tokens older than
+            ``USERENA_ACTIVATION_DAYS`` are rejected. Defaults to ``False``.
+
+        :return:
+            The :class:`UserenaSignup` or raises ``self.model.DoesNotExist``
+            when the key is invalid or the signup is already activated.
+
+        """
+        if userena_settings.USERENA_SIGNED_TOKENS \
+           and not SHA1_RE.search(activation_key):
+            max_age = None
+            if check_age:
+                max_age = userena_settings.USERENA_ACTIVATION_DAYS * 24 * 60 * 60
+            token = check_signed_token(activation_key, 'activation', max_age)
+            if token is None:
+                raise self.model.DoesNotExist
+            # Like the stored keys, a token is used up by the activation.
+            return self.select_related('user').exclude(
+                activation_key=userena_settings.USERENA_ACTIVATED).get(
+                user=token[0])
+        if SHA1_RE.search(activation_key):
+            return self.select_related('user').get(activation_key=activation_key)
+        raise self.model.DoesNotExist
+
     def activate_user(self, activation_key):
         """
         Activate an :class:`User` by supplying a valid ``activation_key``.
@@ -141,24 +417,55 @@ class UserenaManager(UserManager):
             The newly activated :class:`User` or ``False`` if not successful.
 
         """
-        if SHA1_RE.search(activation_key):
-            try:
-                userena = self.get(activation_key=activation_key)
-            except self.model.DoesNotExist:
-                return False
-            if not userena.activation_key_expired():
-                userena.activation_key = userena_settings.USERENA_ACTIVATED
-                user = userena.user
-                user.is_active = True
-                userena.save(using=self._db)
-                user.save(using=self._db)
+        try:
+            userena = self.get_by_activation_key(activation_key, check_age=True)
+        except self.model.DoesNotExist:
+            return False
+        if userena.activation_key_expired():
+            return False
+        return self.activate_signup(userena)
+
+    def activate_signup(self, userena):
+        """
+        Activates the user of a :class:`UserenaSignup` of which the activation
+        key has been checked and sends the ``activation_complete`` signal.
 
-                # Send the activation_complete signal
-                userena_signals.activation_complete.send(sender=None,
-                                                         user=user)
+        When ``USERENA_CONDITIONAL_ACTIVATION`` is ``True`` the signup is
+        flagged as activated with an ``UPDATE`` that only matches a signup
+        that isn't activated yet, so of two simultaneous activations only one
+        succeeds.
 
-                return user
-        return False
+        :param userena:
+            :class:`UserenaSignup` instance with its ``user``.
+
+        :return:
+            The newly activated :class:`User` or ``False`` if the signup was
+            already activated.
+
+        """
+        user = userena.user
+        if userena_settings.USERENA_CONDITIONAL_ACTIVATION:
+            with atomic(using=self._db):
+                updated = self.filter(pk=userena.pk).exclude(
+                    activation_key=userena_settings.USERENA_ACTIVATED).update(
+                    activation_key=userena_settings.USERENA_ACTIVATED)
+                if not updated:
+                    return False
+                user.__class__._default_manager.using(self._db) \
+                    .filter(pk=user.pk).update(is_active=True)
+            userena.activation_key = userena_settings.USERENA_ACTIVATED
+            user.is_active = True
+        else:
+            userena.activation_key = userena_settings.USERENA_ACTIVATED
+            user.is_active = True
+            userena.save(using=self._db, update_fields=['activation_key'])
+            user.save(using=self._db, update_fields=['is_active'])
+
+        # Send the activation_complete signal
+        userena_signals.activation_complete.send(sender=None,
+                                                 user=user)
+
+        return user
 
     def check_expired_activation(self, activation_key):
         """
@@ -174,10 +481,8 @@ class UserenaManager(UserManager):
             True if the ket has expired, False if still valid.
 
         """
-        if SHA1_RE.search(activation_key):
-            userena = self.get(activation_key=activation_key)
-            return userena.activation_key_expired()
-        raise self.model.DoesNotExist
+        userena = self.get_by_activation_key(activation_key)
+        return userena.activation_key_expired()
 
     def confirm_email(self, confirmation_key):
         """
@@ -195,57 +500,237 @@ class UserenaManager(UserManager):
             The verified :class:`User` or ``False`` if not successful.
 
         """
-        if SHA1_RE.search(confirmation_key):
-            try:
-                userena = self.get(email_confirmation_key=confirmation_key,
-                                   email_unconfirmed__isnull=False)
-            except self.model.DoesNotExist:
+        # Stored SHA1 keys, from mails sent before ``USERENA_SIGNED_TOKENS``
+        # was enabled, are still looked up.
+        if userena_settings.USERENA_SIGNED_TOKENS \
+           and not SHA1_RE.search(confirmation_key):
+            # The token is only valid for the email address it was made for,
+            # so it can't be used again after the confirmation.
+            token = check_signed_token(confirmation_key, 'confirmation')
+            if token is None or not token[1]:
                 return False
-            else:
-                user = userena.user
-                old_email = user.email
-                user.email = userena.email_unconfirmed
-                userena.email_unconfirmed, userena.email_confirmation_key = '',''
-                userena.save(using=self._db)
-                user.save(using=self._db)
+            lookup = {'user': token[0], 'email_unconfirmed': token[1]}
+        elif SHA1_RE.search(confirmation_key):
+            lookup = {'email_confirmation_key': confirmation_key,
+                      'email_unconfirmed__isnull': False}
+        else:
+            return False
+
+        try:
+            userena = self.get(**lookup)
+        except self.model.DoesNotExist:
+            return False
+        else:
+            user = userena.user
+            old_email = user.email
+            user.email = userena.email_unconfirmed
+            userena.email_unconfirmed, userena.email_confirmation_key = '',''
+            userena.save(using=self._db, update_fields=['email_unconfirmed',
+                                                        'email_confirmation_key'])
+            user.save(using=self._db, update_fields=['email'])
+
+            # Send the confirmation_complete signal
+            userena_signals.confirmation_complete.send(sender=None,
+                                                       user=user,
+                                                       old_email=old_email)
+
+            return user
+
+    def expired_signups(self):
+        """
+        Returns all :class:`UserenaSignup` instances of which the activation
+        is expired and the ``User`` should be deleted.
+
+        The expiration is evaluated by the database with the same rules as
+        :meth:`UserenaSignup.activation_key_expired`, users that are
+        ``is_staff`` or already active are never returned.
 
-                # Send the confirmation_complete signal
-                userena_signals.confirmation_complete.send(sender=None,
-                                                           user=user,
-                                                           old_email=old_email)
+        :return: A queryset ordered by the primary key of the user.
 
-                return user
-        return False
+        """
+        expiration_date = get_datetime_now() - datetime.timedelta(
+            days=userena_settings.USERENA_ACTIVATION_DAYS)
+        return self.filter(user__is_staff=False,
+                           user__is_active=False).filter(
+            Q(activation_key=userena_settings.USERENA_ACTIVATED) |
+            Q(user__date_joined__lte=expiration_date)).order_by('user')
+
+    def delete_expired_users_in_batches(self, batch_size=1000, since_id=None,
+                                        dry_run=False):
+        """
+        Deletes the expired users in chunks of ``batch_size`` users, each
+        chunk inside its own transaction.
+
+        Users are deleted through a queryset, so the ``pre_delete`` and
+        ``post_delete`` signals are still send for every deleted ``User``.
+
+        :param batch_size:
+            Integer defining the maximum amount of users deleted in one
+            transaction. Defaults to ``1000``.
+
+        :param since_id:
+            Optional primary key of a ``User``. Only users with a higher
+            primary key are deleted, which allows resuming a previous run.
 
-    def delete_expired_users(self):
+        :param dry_run:
+            Boolean that defines if the users are only counted and not
+            deleted. Defaults to ``False``.
+
+        :return:
+            Generator yielding a tuple with the primary key of the last
+            deleted user and the amount of users deleted in the chunk.
+
+        """
+        User = get_user_model()
+        expired = self.expired_signups()
+        while True:
+            if since_id is not None:
+                chunk = expired.filter(user__gt=since_id)
+            else: chunk = expired
+            if dry_run:
+                user_ids = list(chunk.values_list('user', flat=True)[:batch_size])
+                if not user_ids:
+                    return
+            else:
+                with atomic(using=self._db):
+                    user_ids = list(chunk.select_for_update()
+                                    .values_list('user', flat=True)[:batch_size])
+                    if not user_ids:
+                        return
+                    User.objects.filter(pk__in=user_ids).delete()
+            since_id = user_ids[-1]
+            yield since_id, len(user_ids)
+
+    def delete_expired_users(self, batch_size=1000):
         """
         Checks for expired users and delete's the ``User`` associated with
         it. Skips if the user ``is_staff``.
 
-        :return: A list containing the deleted users.
+        :param batch_size:
+            Integer defining the maximum amount of users deleted in one
+            transaction. Defaults to ``1000``.
 
+        :return: The amount of deleted users.
+
+        """
+        deleted = 0
+        for last_id, count in self.delete_expired_users_in_batches(batch_size):
+            deleted += count
+        return deleted
+
+    def reminder_signups(self):
+        """
+        Returns all :class:`UserenaSignup` instances that should get a
+        reminder to activate their account.
+
+        These are the inactive users that didn't get a reminder yet and of
+        which the activation expires within ``USERENA_ACTIVATION_NOTIFY_DAYS``.
+
+        :return: A queryset ordered by the primary key.
+
+        """
+        now = get_datetime_now()
+        expiration_date = now - datetime.timedelta(
+            days=userena_settings.USERENA_ACTIVATION_DAYS)
+        notify_date = expiration_date + datetime.timedelta(
+            days=userena_settings.USERENA_ACTIVATION_NOTIFY_DAYS)
+        return self.filter(activation_notification_send=False,
+                           user__is_active=False,
+                           user__date_joined__gt=expiration_date,
+                           user__date_joined__lte=notify_date).exclude(
+            activation_key=userena_settings.USERENA_ACTIVATED).order_by('pk')
+
+    def send_activation_reminders(self, batch_size=500, dry_run=False):
         """
-        deleted_users = []
-        for user in get_user_model().objects.filter(is_staff=False,
-                                                    is_active=False):
-            if user.userena_signup.activation_key_expired():
-                deleted_users.append(user)
-                user.delete()
-        return deleted_users
+        Sends the reminders to the signups of :meth:`reminder_signups`.
+
+        Every batch is rendered with the same compiled templates, send over
+        one connection and marked with ``activation_notification_send`` in a
+        single ``UPDATE``.
+
+        :param batch_size:
+            Integer defining the amount of reminders send at once. Defaults
+            to ``500``.
+
+        :param dry_run:
+            Boolean that defines if the reminders are only counted and not
+            send. Defaults to ``False``.
+
+        :return:
+            Generator yielding a tuple with the amount of reminders in the
+            batch and the seconds it took to send them.
 
-    def check_permissions(self):
+        """
+        mailer = UserenaConfirmationMail(context={
+            'without_usernames': userena_settings.USERENA_WITHOUT_USERNAMES,
+            'protocol': get_protocol(),
+            'activation_days': userena_settings.USERENA_ACTIVATION_DAYS,
+            'site': Site.objects.get_current()})
+        activation_days = datetime.timedelta(
+            days=userena_settings.USERENA_ACTIVATION_DAYS)
+
+        last_id = 0
+        while True:
+            signups = list(self.reminder_signups().select_related('user')
+                           .filter(pk__gt=last_id)[:batch_size])
+            if not signups:
+                return
+            last_id = signups[-1].pk
+
+            if dry_run:
+                yield len(signups), 0
+                continue
+
+            recipients = [({'user': signup.user,
+                            'activation_key': signup.get_activation_key(),
+                            'expiration_date': signup.user.date_joined + activation_days},
+                           signup.user.email)
+                          for signup in signups if signup.user.email]
+            sent, seconds = send_mass_mail(
+                mailer.build_messages('activation_reminder', recipients))
+            self.filter(pk__in=[signup.pk for signup in signups]) \
+                .update(activation_notification_send=True)
+            yield sent, seconds
+
+    def check_permissions(self, dry_run=False, chunk_size=1000):
         """
         Checks that all permissions are set correctly for the users.
 
-        :return: A set of users whose permissions was wrong.
+        Missing object permissions are computed per chunk of users with a
+        fixed amount of queries and repaired with ``bulk_create``. Profiles
+        are never created, users without a profile result in a warning.
+
+        :param dry_run:
+            Boolean that defines if only the differences are reported and
+            nothing is written. Defaults to ``False``.
+
+        :param chunk_size:
+            Integer defining the amount of users checked at once. Defaults to
+            ``1000``.
+
+        :return:
+            A tuple containing the names of the created permissions, a list
+            of tuples with the username and the codenames of the repaired
+            permissions per user and a list of warnings.
 
         """
-        # Variable to supply some feedback
-        changed_permissions = []
-        changed_users = []
-        warnings = []
+        changed_permissions = self.check_model_permissions(dry_run)
+        changed_users, warnings = self.check_user_permissions(dry_run,
+                                                              chunk_size)
+        return (changed_permissions, changed_users, warnings)
+
+    def check_model_permissions(self, dry_run=False):
+        """
+        Checks that all the ``ASSIGNED_PERMISSIONS`` are available and
+        creates them when missing.
+
+        :param dry_run:
+            Boolean that defines if missing permissions are only reported.
 
-        # Check that all the permissions are available.
+        :return: A list with the names of the missing permissions.
+
+        """
+        changed_permissions = []
         for model, perms in ASSIGNED_PERMISSIONS.items():
             if model == 'profile':
                 model_obj = get_profile_model()
@@ -253,41 +738,289 @@ class UserenaManager(UserManager):
 
             model_content_type = ContentType.objects.get_for_model(model_obj)
 
+            existing = set(Permission.objects.filter(
+                content_type=model_content_type,
+                codename__in=[perm[0] for perm in perms]).values_list(
+                    'codename', flat=True))
             for perm in perms:
-                try:
-                    Permission.objects.get(codename=perm[0],
-                                           content_type=model_content_type)
-                except Permission.DoesNotExist:
+                if perm[0] not in existing:
                     changed_permissions.append(perm[1])
-                    Permission.objects.create(name=perm[1],
-                                              codename=perm[0],
-                                              content_type=model_content_type)
+                    if not dry_run:
+                        Permission.objects.create(name=perm[1],
+                                                  codename=perm[0],
+                                                  content_type=model_content_type)
+        return changed_permissions
+
+    def check_user_permissions(self, dry_run=False, chunk_size=1000,
+                               min_id=None, max_id=None):
+        """
+        Checks and repairs the object permissions of the users.
+
+        :param dry_run:
+            Boolean that defines if missing permissions are only reported.
+
+        :param chunk_size:
+            Integer defining the amount of users checked at once.
+
+        :param min_id:
+            Optional lowest primary key of the users that are checked.
+
+        :param max_id:
+            Optional highest primary key of the users that are checked.
+
+        :return:
+            A tuple containing a list of tuples with the username and the
+            codenames of the repaired permissions per user and a list of
+            warnings.
+
+        """
+        changed_users = []
+        warnings = []
 
         # it is safe to rely on settings.ANONYMOUS_USER_ID since it is a
         # requirement of django-guardian
-        for user in get_user_model().objects.exclude(id=settings.ANONYMOUS_USER_ID):
-            try:
-                user_profile = get_user_profile(user=user)
-            except ObjectDoesNotExist:
+        users = get_user_model().objects.exclude(
+            id=settings.ANONYMOUS_USER_ID).order_by('pk')
+        if max_id is not None:
+            users = users.filter(pk__lte=max_id)
+        if min_id is not None:
+            users = users.filter(pk__gte=min_id)
+
+        last_pk = None
+        while True:
+            if last_pk is not None:
+                chunk = users.filter(pk__gt=last_pk)
+            else: chunk = users
+            chunk = list(chunk.values_list('pk', 'username')[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1][0]
+
+            chunk_changed, chunk_warnings = self._check_permissions_chunk(
+                chunk, dry_run)
+            changed_users.extend(chunk_changed)
+            warnings.extend(chunk_warnings)
+
+        return changed_users, warnings
+
+    def _check_permissions_chunk(self, users, dry_run):
+        """
+        Computes and repairs the missing permissions for ``users``, a list of
+        ``(pk, username)`` tuples.
+
+        """
+        # With ``dry_run`` the missing permissions aren't created, so check
+        # the users against the ones that exist.
+        profile_type, profile_perms = get_assigned_permissions('profile',
+                                                               strict=False)
+        user_type, user_perms = get_assigned_permissions('user', strict=False)
+        user_ids = [pk for pk, username in users]
+
+        profiles = dict(get_profile_model().objects.filter(
+            user__in=user_ids).values_list('user', 'pk'))
+        existing = set(UserObjectPermission.objects.filter(
+            user__in=user_ids,
+            permission__in=profile_perms + user_perms).values_list(
+                'user', 'permission', 'object_pk'))
+
+        changed_users = []
+        warnings = []
+        missing = []
+        for pk, username in users:
+            if pk not in profiles:
                 warnings.append(_("No profile found for %(username)s") \
-                                    % {'username': user.username})
-            else:
-                all_permissions = get_perms(user, user_profile) + get_perms(user, user)
+                                    % {'username': username})
+                continue
+
+            codenames = []
+            for content_type, permissions, object_pk in (
+                    (profile_type, profile_perms, profiles[pk]),
+                    (user_type, user_perms, pk)):
+                for permission in permissions:
+                    if (pk, permission.pk, text_type(object_pk)) in existing:
+                        continue
+                    codenames.append(permission.codename)
+                    missing.append(UserObjectPermission(
+                        user_id=pk,
+                        permission=permission,
+                        content_type=content_type,
+                        object_pk=object_pk))
+            if codenames:
+                changed_users.append((username, codenames))
+
+        if missing and not dry_run:
+            UserObjectPermission.objects.bulk_create(missing)
+        return changed_users, warnings
+
+class UserenaOutboxManager(models.Manager):
+    """ Manager for :class:`UserenaOutboxMessage` """
+
+    def send_pending(self, batch_size=100, max_attempts=5, backoff=60,
+                     claim_timeout=300):
+        """
+        Sends the messages that are due over a single mail connection.
 
-                for model, perms in ASSIGNED_PERMISSIONS.items():
-                    if model == 'profile':
-                        perm_object = get_user_profile(user=user)
-                    else: perm_object = user
+        Every message is claimed first by moving its ``next_attempt``
+        ``claim_timeout`` seconds ahead with an ``UPDATE`` that only matches
+        while it's still due. So when several workers run at the same time
+        each message is sent by one of them, and a message of a worker that
+        died is picked up again after ``claim_timeout``.
 
-                    for perm in perms:
-                        if perm[0] not in all_permissions:
-                            assign_perm(perm[0], user, perm_object)
-                            changed_users.append(user)
+        Sent messages are deleted. When sending fails the attempt is recorded
+        and the message is retried after ``backoff * 2 ** attempts``
+        seconds, until ``max_attempts`` is reached.
+
+        :param batch_size:
+            Integer with the maximum amount of messages send in this call.
+
+        :param max_attempts:
+            Integer, messages that failed this many times are left alone.
+
+        :param backoff:
+            Integer with the seconds before the first retry.
+
+        :param claim_timeout:
+            Integer with the seconds a claimed message is left alone by other
+            workers.
+
+        :return: Tuple of the amount of sent and failed messages.
+
+        """
+        from django.core.mail import get_connection
+
+        now = get_datetime_now()
+        claimed_until = now + datetime.timedelta(seconds=claim_timeout)
+        due = self.filter(next_attempt__lte=now, attempts__lt=max_attempts)
+        pending = [message for message in
+                   list(due.order_by('next_attempt', 'pk')[:batch_size])
+                   if due.filter(pk=message.pk)
+                         .update(next_attempt=claimed_until)]
+        if not pending:
+            return 0, 0
+
+        sent, failed = [], 0
+        connection = get_connection()
+        try:
+            for message in pending:
+                email = message.to_message()
+                email.connection = connection
+                try:
+                    # Keeps the session open between the messages, does
+                    # nothing when it already is.
+                    connection.open()
+                    connection.send_messages([email])
+                except Exception as e:
+                    failed += 1
+                    self.filter(pk=message.pk).update(
+                        attempts=models.F('attempts') + 1,
+                        last_error=text_type(e),
+                        next_attempt=now + datetime.timedelta(
+                            seconds=backoff * 2 ** message.attempts))
+                    # The connection may be broken, start with a fresh one.
+                    connection.close()
+                    connection = get_connection()
+                else:
+                    sent.append(message.pk)
+        finally:
+            connection.close()
+
+        if sent:
+            self.filter(pk__in=sent).delete()
+        return len(sent), failed
+
+def bulk_can_view(user, profiles):
+    """
+    Evaluates :meth:`UserenaBaseProfile.can_view_profile` for many profiles
+    at once.
+
+    Profiles that are ``open``, or ``registered`` with a registered ``user``,
+    are decided without the database. For the others the ``view_profile``
+    object permissions of ``user`` and of their groups are loaded with one
+    query each, instead of checking every profile with guardian.
+
+    :param user:
+        A Django :class:`User` or :class:`AnonymousUser` instance.
+
+    :param profiles:
+        Iterable of profiles of the same model.
+
+    :return:
+        Dictionary with the primary key of every profile as key and whether
+        ``user`` can view it as value.
+
+    """
+    User = get_user_model()
+    registered = isinstance(user, User)
+    can_view, others = {}, []
+    for profile in profiles:
+        can_view[profile.pk] = profile.privacy == 'open' \
+            or (profile.privacy == 'registered' and registered)
+        if not can_view[profile.pk]:
+            others.append(profile)
+
+    # Guardian gives no permissions to inactive users and all of them to
+    # superusers.
+    if not others or (registered and not user.is_active):
+        return can_view
+    if registered and user.is_superuser:
+        for profile in others:
+            can_view[profile.pk] = True
+        return can_view
+
+    user_id = user.pk if registered else settings.ANONYMOUS_USER_ID
+    filters = {'content_type': ContentType.objects.get_for_model(others[0]),
+               'permission__codename': 'view_profile',
+               'object_pk__in': [text_type(profile.pk) for profile in others]}
+    granted = set(UserObjectPermission.objects.filter(user=user_id, **filters)
+                  .values_list('object_pk', flat=True))
+    group_filter = 'group__%s' % User.groups.field.related_query_name()
+    filters[group_filter] = user_id
+    granted.update(GroupObjectPermission.objects.filter(**filters)
+                   .values_list('object_pk', flat=True))
+
+    for profile in others:
+        can_view[profile.pk] = text_type(profile.pk) in granted
+    return can_view
+
+
+def uses_visibility(profile_model):
+    """
+    Returns ``True`` when ``USERENA_DENORMALIZED_VISIBILITY`` is enabled and
+    ``profile_model`` has the :class:`UserenaVisibilityMixin`.
+
+    """
+    from userena.models import UserenaVisibilityMixin
+    return bool(userena_settings.USERENA_DENORMALIZED_VISIBILITY) \
+        and issubclass(profile_model, UserenaVisibilityMixin)
+
+
+class UserenaBaseProfileQuerySet(models.query.QuerySet):
+    """ QuerySet of :class:`UserenaProfile` """
+    def viewable_by(self, user):
+        """
+        Returns a list of the profiles that ``user`` can view, checked with
+        :func:`bulk_can_view`.
+
+        :param user:
+            A Django :class:`User` or :class:`AnonymousUser` instance.
+
+        """
+        profiles = list(self)
+        can_view = bulk_can_view(user, profiles)
+        return [profile for profile in profiles if can_view[profile.pk]]
 
-        return (changed_permissions, changed_users, warnings)
 
 class UserenaBaseProfileManager(models.Manager):
     """ Manager for :class:`UserenaProfile` """
+    def get_queryset(self):
+        return UserenaBaseProfileQuerySet(self.model, using=self._db)
+    # Django < 1.6
+    get_query_set = get_queryset
+
+    def viewable_by(self, user):
+        """ Returns a list of the profiles that ``user`` can view. """
+        return self.get_queryset().viewable_by(user)
+
     def get_visible_profiles(self, user=None):
         """
         Returns all the visible profiles available to this user.
@@ -296,6 +1029,10 @@ class UserenaBaseProfileManager(models.Manager):
         active, a user has it's profile closed to everyone or a user only
         allows registered users to view their profile.
 
+        With ``USERENA_DENORMALIZED_VISIBILITY`` and a profile model with the
+        :class:`UserenaVisibilityMixin` the profiles are only filtered on
+        their ``visibility``, without a join with the users.
+
         :param user:
             A Django :class:`User` instance.
 
@@ -305,6 +1042,11 @@ class UserenaBaseProfileManager(models.Manager):
         """
         profiles = self.all()
 
+        if self.uses_visibility():
+            if user and isinstance(user, AnonymousUser):
+                return profiles.filter(visibility__gte=self.model.VISIBILITY_OPEN)
+            return profiles.filter(visibility__gte=self.model.VISIBILITY_REGISTERED)
+
         filter_kwargs = {'user__is_active': True}
 
         profiles = profiles.filter(**filter_kwargs)
@@ -312,3 +1054,43 @@ class UserenaBaseProfileManager(models.Manager):
             profiles = profiles.exclude(Q(privacy='closed') | Q(privacy='registered'))
         else: profiles = profiles.exclude(Q(privacy='closed'))
         return profiles
+
+    def uses_visibility(self):
+        """ Returns :func:`uses_visibility` for the model of this manager. """
+        return uses_visibility(self.model)
+
+    def _visibility_cases(self):
+        """ Returns tuples of a filter and the visibility that it implies. """
+        return ((Q(user__is_active=False) | Q(privacy='closed'),
+                 self.model.VISIBILITY_HIDDEN),
+                (Q(user__is_active=True, privacy='registered'),
+                 self.model.VISIBILITY_REGISTERED),
+                (Q(user__is_active=True, privacy='open'),
+                 self.model.VISIBILITY_OPEN))
+
+    def inconsistent_visibility(self):
+        """
+        Returns the profiles of which the ``visibility`` doesn't match their
+        ``privacy`` and whether their user is active.
+
+        """
+        return self.filter(reduce(operator.or_, [
+            case & ~Q(visibility=visibility)
+            for case, visibility in self._visibility_cases()]))
+
+    def update_visibility(self, **filters):
+        """
+        Sets the ``visibility`` of the profiles that match ``filters`` with
+        one ``UPDATE`` per value, skipping the profiles that are already
+        correct.
+
+        :return:
+            The amount of profiles that were updated.
+
+        """
+        profiles = self.filter(**filters)
+        updated = 0
+        for case, visibility in self._visibility_cases():
+            updated += profiles.filter(case).exclude(visibility=visibility) \
+                               .update(visibility=visibility)
+        return updated
@@ -3,9 +3,59 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.conf import settings
 
 from userena import settings as userena_settings
-from userena.compat import SiteProfileNotAvailable
+from userena.compat import SiteProfileNotAvailable, get_cache
 from userena.utils import get_user_profile
 
+LANGUAGE_CACHE_KEY = 'userena_language_%s'
+
+
+def get_language_cache():
+    """
+    Returns the cache defined by ``USERENA_LANGUAGE_CACHE`` or ``None`` when
+    the language of users shouldn't be cached.
+
+    """
+    if userena_settings.USERENA_LANGUAGE_CACHE:
+        return get_cache(userena_settings.USERENA_LANGUAGE_CACHE)
+    return None
+
+
+def get_user_language(user):
+    """
+    Returns the language from the profile of ``user`` or ``None`` when the
+    user has no profile or language preference.
+
+    """
+    cache = get_language_cache()
+    if cache is not None:
+        lang = cache.get(LANGUAGE_CACHE_KEY % user.pk)
+        if lang is not None:
+            return lang or None
+
+    try:
+        profile = get_user_profile(
+            user=user,
+            create=not userena_settings.USERENA_READ_ONLY_PROFILES)
+    except (ObjectDoesNotExist, SiteProfileNotAvailable):
+        profile = False
+
+    lang = None
+    # An unsaved default profile holds no language preference.
+    if profile and profile.pk:
+        lang = getattr(profile, userena_settings.USERENA_LANGUAGE_FIELD, None)
+
+    if cache is not None:
+        # An empty string is cached for users without a preference.
+        cache.set(LANGUAGE_CACHE_KEY % user.pk, lang or '')
+    return lang or None
+
+
+def clear_user_language(user_id):
+    """ Removes the cached language of the user with the id ``user_id``. """
+    cache = get_language_cache()
+    if cache is not None:
+        cache.delete(LANGUAGE_CACHE_KEY % user_id)
+
 
 class UserenaLocaleMiddleware(object):
     """
@@ -14,19 +64,15 @@ class UserenaLocaleMiddleware(object):
     It doesn't override the cookie that is set by Django so a user can still
     switch languages depending if the cookie is set.
 
+    When ``USERENA_LANGUAGE_CACHE`` is set the language is cached per user, so
+    the profile is only read once until it changes.
+
     """
     def process_request(self, request):
         lang_cookie = request.session.get(settings.LANGUAGE_COOKIE_NAME)
         if not lang_cookie:
             if request.user.is_authenticated():
-                try:
-                    profile = get_user_profile(user=request.user)
-                except (ObjectDoesNotExist, SiteProfileNotAvailable):
-                    profile = False
-
-                if profile:
-                    try:
-                        lang = getattr(profile, userena_settings.USERENA_LANGUAGE_FIELD)
-                        translation.activate(lang)
-                        request.LANGUAGE_CODE = translation.get_language()
-                    except AttributeError: pass
+                lang = get_user_language(request.user)
+                if lang:
+                    translation.activate(lang)
+                    request.LANGUAGE_CODE = translation.get_language()
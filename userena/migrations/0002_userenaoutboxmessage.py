@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import userena.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userena', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserenaOutboxMessage',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('subject', models.TextField(verbose_name='subject')),
+                ('body', models.TextField(verbose_name='body')),
+                ('html_body', models.TextField(verbose_name='HTML body', blank=True)),
+                ('from_email', models.CharField(max_length=254, verbose_name='from email')),
+                ('recipients', models.TextField(help_text='JSON list of email addresses.', verbose_name='recipients')),
+                ('headers', models.TextField(help_text='JSON object of extra headers.', verbose_name='headers', blank=True)),
+                ('created', models.DateTimeField(default=userena.utils.get_datetime_now, verbose_name='created')),
+                ('next_attempt', models.DateTimeField(default=userena.utils.get_datetime_now, verbose_name='next attempt', db_index=True)),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('last_error', models.TextField(verbose_name='last error', blank=True)),
+            ],
+            options={
+                'verbose_name': 'outbox message',
+                'verbose_name_plural': 'outbox messages',
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userena', '0002_userenaoutboxmessage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userenasignup',
+            name='activation_key',
+            field=models.CharField(max_length=40, verbose_name='activation key', db_index=True, blank=True),
+        ),
+        migrations.AlterField(
+            model_name='userenasignup',
+            name='email_confirmation_key',
+            field=models.CharField(max_length=40, verbose_name='unconfirmed email verification key', db_index=True, blank=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='userenasignup',
+            index_together=set([('activation_notification_send', 'id')]),
+        ),
+    ]
@@ -4,22 +4,33 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
 from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.utils.encoding import python_2_unicode_compatible
+from django.utils.six import get_unbound_function
 from django.utils.translation import ugettext_lazy as _
 from easy_thumbnails.fields import ThumbnailerImageField
 from guardian.shortcuts import get_perms
 from userena import settings as userena_settings
-from userena.managers import UserenaManager, UserenaBaseProfileManager
-from userena.utils import get_gravatar, generate_sha1, get_protocol, \
-    get_datetime_now, user_model_label
+from userena import signals as userena_signals
+from userena.compat import SiteProfileNotAvailable
+from userena.managers import UserenaManager, UserenaBaseProfileManager, \
+    UserenaOutboxManager, uses_visibility
+from userena.middleware import clear_user_language
+from userena.paginator import clear_profile_counts
+from userena.utils import get_gravatar, get_gravatar_id, get_gravatar_parts, \
+    generate_key, get_protocol, get_datetime_now, get_profile_model, user_model_label, make_signed_token
 import datetime
-from .mail import UserenaConfirmationMail
+import json
+from .mail import UserenaConfirmationMail, build_mail, send_mass_mail
 
 
 PROFILE_PERMISSIONS = (
             ('view_profile', 'Can view profile'),
 )
 
+# Values of ``USERENA_MUGSHOT_DEFAULT`` that only Gravatar knows.
+GRAVATAR_DEFAULTS = ('404', 'mm', 'identicon', 'monsterid', 'wavatar')
+
 
 def upload_to_mugshot(instance, filename):
     """
@@ -29,7 +40,7 @@ def upload_to_mugshot(instance, filename):
 
     """
     extension = filename.split('.')[-1].lower()
-    salt, hash = generate_sha1(instance.pk)
+    hash = generate_key()
     path = userena_settings.USERENA_MUGSHOT_PATH % {'username': instance.user.username,
                                                     'id': instance.user.id,
                                                     'date': instance.user.date_joined,
@@ -57,7 +68,8 @@ class UserenaSignup(models.Model):
 
     activation_key = models.CharField(_('activation key'),
                                       max_length=40,
-                                      blank=True)
+                                      blank=True,
+                                      db_index=True)
 
     activation_notification_send = models.BooleanField(_('notification send'),
                                                        default=False,
@@ -69,7 +81,8 @@ class UserenaSignup(models.Model):
 
     email_confirmation_key = models.CharField(_('unconfirmed email verification key'),
                                               max_length=40,
-                                              blank=True)
+                                              blank=True,
+                                              db_index=True)
 
     email_confirmation_key_created = models.DateTimeField(_('creation date of email confirmation key'),
                                                           blank=True,
@@ -80,10 +93,36 @@ class UserenaSignup(models.Model):
     class Meta:
         verbose_name = _('userena registration')
         verbose_name_plural = _('userena registrations')
+        # Supports the keyset scan of the activation reminders.
+        index_together = (('activation_notification_send', 'id'),)
 
     def __str__(self):
         return '%s' % self.user.username
 
+    def get_activation_key(self):
+        """
+        Returns the key used in the activation link. This is the
+        ``activation_key`` or a signed token when ``USERENA_SIGNED_TOKENS``
+        is ``True``.
+
+        """
+        if userena_settings.USERENA_SIGNED_TOKENS:
+            return make_signed_token(self.user_id, 'activation')
+        return self.activation_key
+
+    def get_confirmation_key(self):
+        """
+        Returns the key used in the email confirmation link. This is the
+        ``email_confirmation_key`` or a signed token for the
+        ``email_unconfirmed`` address when ``USERENA_SIGNED_TOKENS`` is
+        ``True``.
+
+        """
+        if userena_settings.USERENA_SIGNED_TOKENS:
+            return make_signed_token(self.user_id, 'confirmation',
+                                     self.email_unconfirmed)
+        return self.email_confirmation_key
+
     def change_email(self, email):
         """
         Changes the email address for a user.
@@ -100,10 +139,10 @@ class UserenaSignup(models.Model):
         """
         self.email_unconfirmed = email
 
-        salt, hash = generate_sha1(self.user.username)
-        self.email_confirmation_key = hash
+        self.email_confirmation_key = generate_key()
         self.email_confirmation_key_created = get_datetime_now()
-        self.save()
+        self.save(update_fields=['email_unconfirmed', 'email_confirmation_key',
+                                 'email_confirmation_key_created'])
 
         # Send email for activation
         self.send_confirmation_email()
@@ -124,17 +163,21 @@ class UserenaSignup(models.Model):
                   'without_usernames': userena_settings.USERENA_WITHOUT_USERNAMES,
                   'new_email': self.email_unconfirmed,
                   'protocol': get_protocol(),
-                  'confirmation_key': self.email_confirmation_key,
+                  'confirmation_key': self.get_confirmation_key(),
                   'site': Site.objects.get_current()}
 
         mailer = UserenaConfirmationMail(context=context)
-        mailer.generate_mail("confirmation", "_old")
+        messages = []
 
         if self.user.email:
-            mailer.send_mail(self.user.email)
+            mailer.generate_mail("confirmation", "_old")
+            messages.append(mailer.build_message(self.user.email))
 
         mailer.generate_mail("confirmation", "_new")
-        mailer.send_mail(self.email_unconfirmed)
+        messages.append(mailer.build_message(self.email_unconfirmed))
+
+        # Both emails share one connection to the mail server.
+        send_mass_mail(messages)
 
     def activation_key_expired(self):
         """
@@ -163,17 +206,102 @@ class UserenaSignup(models.Model):
         This email is send when the user wants to activate their newly created
         user.
 
+        """
+        send_mass_mail([self.build_activation_email()])
+
+    def build_activation_email(self):
+        """
+        Returns the activation email of :meth:`send_activation_email` without
+        sending it, so many can be send at once with
+        :func:`userena.mail.send_mass_mail`.
+
         """
         context = {'user': self.user,
                   'without_usernames': userena_settings.USERENA_WITHOUT_USERNAMES,
                   'protocol': get_protocol(),
                   'activation_days': userena_settings.USERENA_ACTIVATION_DAYS,
-                  'activation_key': self.activation_key,
+                  'activation_key': self.get_activation_key(),
                   'site': Site.objects.get_current()}
 
         mailer = UserenaConfirmationMail(context=context)
         mailer.generate_mail("activation")
-        mailer.send_mail(self.user.email)
+        return mailer.build_message(self.user.email)
+
+
+@python_2_unicode_compatible
+class UserenaOutboxMessage(models.Model):
+    """
+    A rendered email waiting to be send by the ``userena_send_mail`` command.
+
+    Used when ``USERENA_MAIL_DELIVERY`` is set to
+    ``userena.mail.OutboxDelivery``.
+
+    """
+    subject = models.TextField(_('subject'))
+
+    body = models.TextField(_('body'))
+
+    html_body = models.TextField(_('HTML body'),
+                                 blank=True)
+
+    from_email = models.CharField(_('from email'),
+                                  max_length=254)
+
+    recipients = models.TextField(_('recipients'),
+                                  help_text=_('JSON list of email addresses.'))
+
+    headers = models.TextField(_('headers'),
+                               blank=True,
+                               help_text=_('JSON object of extra headers.'))
+
+    created = models.DateTimeField(_('created'),
+                                   default=get_datetime_now)
+
+    next_attempt = models.DateTimeField(_('next attempt'),
+                                        default=get_datetime_now,
+                                        db_index=True)
+
+    attempts = models.PositiveIntegerField(_('attempts'),
+                                           default=0)
+
+    last_error = models.TextField(_('last error'),
+                                  blank=True)
+
+    objects = UserenaOutboxManager()
+
+    class Meta:
+        verbose_name = _('outbox message')
+        verbose_name_plural = _('outbox messages')
+
+    def __str__(self):
+        return '%s' % self.subject
+
+    @classmethod
+    def from_message(cls, msg):
+        """
+        Returns an unsaved outbox message for an ``EmailMultiAlternatives``
+        instance.
+
+        """
+        html_body = ''
+        for content, mimetype in getattr(msg, 'alternatives', []):
+            if mimetype == 'text/html':
+                html_body = content
+        return cls(subject=msg.subject,
+                   body=msg.body,
+                   html_body=html_body,
+                   from_email=msg.from_email,
+                   recipients=json.dumps(list(msg.to)),
+                   headers=json.dumps(msg.extra_headers) if msg.extra_headers else '')
+
+    def to_message(self):
+        """ Returns the ``EmailMultiAlternatives`` of this message. """
+        return build_mail(self.subject,
+                          self.body,
+                          self.html_body or None,
+                          self.from_email,
+                          json.loads(self.recipients),
+                          json.loads(self.headers) if self.headers else {})
 
 
 @python_2_unicode_compatible
@@ -252,14 +380,48 @@ class UserenaBaseProfile(models.Model):
 
         # Gravatar not used, check for a default image.
         else:
-            if userena_settings.USERENA_MUGSHOT_DEFAULT not in ['404', 'mm',
-                                                                'identicon',
-                                                                'monsterid',
-                                                                'wavatar']:
+            if userena_settings.USERENA_MUGSHOT_DEFAULT not in GRAVATAR_DEFAULTS:
                 return userena_settings.USERENA_MUGSHOT_DEFAULT
             else:
                 return None
 
+    @classmethod
+    def get_mugshot_urls(cls, profiles):
+        """
+        Returns the :meth:`get_mugshot_url` of every profile in ``profiles``,
+        used to resolve the mugshots of a page at once.
+
+        The Gravatar URL parts and the default image are resolved once for
+        all profiles and every email address is only hashed once. Models that
+        override :meth:`get_mugshot_url` get it called per profile.
+
+        """
+        if get_unbound_function(cls.get_mugshot_url) is not \
+           get_unbound_function(UserenaBaseProfile.get_mugshot_url):
+            return [profile.get_mugshot_url() for profile in profiles]
+
+        gravatar = None
+        default_url = None
+        if userena_settings.USERENA_MUGSHOT_GRAVATAR:
+            gravatar = get_gravatar_parts(userena_settings.USERENA_MUGSHOT_SIZE,
+                                          userena_settings.USERENA_MUGSHOT_DEFAULT)
+        elif userena_settings.USERENA_MUGSHOT_DEFAULT not in GRAVATAR_DEFAULTS:
+            default_url = userena_settings.USERENA_MUGSHOT_DEFAULT
+
+        gravatar_ids = {}
+        urls = []
+        for profile in profiles:
+            if profile.mugshot:
+                urls.append(profile.mugshot.url)
+            elif gravatar is not None:
+                email = profile.user.email
+                if email not in gravatar_ids:
+                    gravatar_ids[email] = get_gravatar_id(email)
+                urls.append(gravatar[0] + gravatar_ids[email] + gravatar[1])
+            else:
+                urls.append(default_url)
+        return urls
+
     def get_full_name_or_username(self):
         """
         Returns the full name of the user, or if none is supplied will return
@@ -315,6 +477,9 @@ class UserenaBaseProfile(models.Model):
         Through the ``privacy`` field a owner of an profile can define what
         they want to show to whom.
 
+        Use :func:`userena.managers.bulk_can_view` to check many profiles at
+        once.
+
         :param user:
             A Django :class:`User` instance.
 
@@ -336,6 +501,45 @@ class UserenaBaseProfile(models.Model):
         return False
 
 
+class UserenaVisibilityMixin(models.Model):
+    """
+    Adds an indexed ``visibility`` field to a profile, derived from its
+    ``privacy`` and whether its user is active. With
+    ``USERENA_DENORMALIZED_VISIBILITY`` it's kept up to date and
+    ``get_visible_profiles`` only filters on it.
+
+    List it after :class:`UserenaBaseProfile`, so the permissions of its
+    ``Meta`` are kept::
+
+        class Profile(UserenaBaseProfile, UserenaVisibilityMixin):
+            ...
+
+    """
+    VISIBILITY_HIDDEN = 0
+    VISIBILITY_REGISTERED = 1
+    VISIBILITY_OPEN = 2
+
+    visibility = models.PositiveSmallIntegerField(_('visibility'),
+                                                  default=VISIBILITY_HIDDEN,
+                                                  db_index=True,
+                                                  editable=False)
+
+    class Meta:
+        abstract = True
+
+    def get_visibility(self):
+        """
+        Returns the value of ``visibility`` that follows from the ``privacy``
+        of this profile and whether its user is active.
+
+        """
+        if not self.user.is_active or self.privacy == 'closed':
+            return self.VISIBILITY_HIDDEN
+        elif self.privacy == 'registered':
+            return self.VISIBILITY_REGISTERED
+        return self.VISIBILITY_OPEN
+
+
 class UserenaLanguageBaseProfile(UserenaBaseProfile):
     """
     Extends the :class:`UserenaBaseProfile` with a language choice.
@@ -353,3 +557,107 @@ class UserenaLanguageBaseProfile(UserenaBaseProfile):
     class Meta:
         abstract = True
         permissions = PROFILE_PERMISSIONS
+
+
+def clear_profile_language(sender, instance, **kwargs):
+    """ Removes the cached language of a user when their profile changes. """
+    if not userena_settings.USERENA_LANGUAGE_CACHE:
+        return
+    try:
+        if sender is not get_profile_model():
+            return
+    except SiteProfileNotAvailable:
+        return
+    clear_user_language(instance.user_id)
+
+post_save.connect(clear_profile_language,
+                  dispatch_uid='userena_clear_profile_language')
+post_delete.connect(clear_profile_language,
+                    dispatch_uid='userena_clear_profile_language')
+
+
+def clear_changed_language(sender, user, **kwargs):
+    """ Removes the cached language of a user after ``profile_change``. """
+    clear_user_language(user.pk)
+
+userena_signals.profile_change.connect(clear_changed_language,
+                                       dispatch_uid='userena_clear_changed_language')
+
+
+
+def clear_cached_profile_counts(sender, **kwargs):
+    """
+    Removes the cached amounts of visible profiles when a user signs up, is
+    activated, changes their profile or when a profile is deleted.
+
+    """
+    if not userena_settings.USERENA_PROFILE_LIST_COUNT_CACHE:
+        return
+    if sender is not None:
+        try:
+            if sender is not get_profile_model():
+                return
+        except SiteProfileNotAvailable:
+            return
+    clear_profile_counts()
+
+userena_signals.signup_complete.connect(clear_cached_profile_counts,
+                                        dispatch_uid='userena_clear_cached_profile_counts')
+userena_signals.activation_complete.connect(clear_cached_profile_counts,
+                                            dispatch_uid='userena_clear_cached_profile_counts')
+userena_signals.profile_change.connect(clear_cached_profile_counts,
+                                       dispatch_uid='userena_clear_cached_profile_counts')
+post_delete.connect(clear_cached_profile_counts,
+                    dispatch_uid='userena_clear_cached_profile_counts')
+
+
+def set_profile_visibility(sender, instance, raw=False, **kwargs):
+    """ Derives the ``visibility`` of a profile before it's saved. """
+    if not userena_settings.USERENA_DENORMALIZED_VISIBILITY or raw:
+        return
+    if isinstance(instance, UserenaVisibilityMixin) and instance.user_id is not None:
+        instance.visibility = instance.get_visibility()
+
+pre_save.connect(set_profile_visibility,
+                 dispatch_uid='userena_set_profile_visibility')
+
+
+def save_profile_visibility(sender, instance, update_fields=None, **kwargs):
+    """ Writes the ``visibility`` when only the ``privacy`` is saved. """
+    if not userena_settings.USERENA_DENORMALIZED_VISIBILITY:
+        return
+    if isinstance(instance, UserenaVisibilityMixin) and update_fields \
+       and 'privacy' in update_fields and 'visibility' not in update_fields:
+        sender._default_manager.filter(pk=instance.pk) \
+                               .update(visibility=instance.visibility)
+
+post_save.connect(save_profile_visibility,
+                  dispatch_uid='userena_save_profile_visibility')
+
+
+def update_user_visibility(sender, user, **kwargs):
+    """ Updates the ``visibility`` of the profile of an (in)activated user. """
+    if not userena_settings.USERENA_DENORMALIZED_VISIBILITY:
+        return
+    try:
+        profile_model = get_profile_model()
+    except SiteProfileNotAvailable:
+        return
+    if uses_visibility(profile_model):
+        profile_model.objects.update_visibility(user=user)
+
+userena_signals.activation_complete.connect(update_user_visibility,
+                                            dispatch_uid='userena_update_user_visibility')
+
+
+def update_saved_user_visibility(sender, instance, created, update_fields=None,
+                                 **kwargs):
+    """ Updates the ``visibility`` of a profile when its user is saved. """
+    if not userena_settings.USERENA_DENORMALIZED_VISIBILITY \
+       or sender is not get_user_model() or created \
+       or (update_fields is not None and 'is_active' not in update_fields):
+        return
+    update_user_visibility(sender, instance)
+
+post_save.connect(update_saved_user_visibility,
+                  dispatch_uid='userena_update_saved_user_visibility')
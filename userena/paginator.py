@@ -0,0 +1,161 @@
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import connections
+
+from userena import settings as userena_settings
+from userena.compat import get_cache
+
+import re
+
+PROFILE_COUNT_CACHE_KEY = 'userena_profile_count_%s'
+
+_EXPLAIN_ROWS = re.compile(r'rows=(\d+)')
+
+
+def get_profile_count_cache():
+    """
+    Returns the cache defined by ``USERENA_PROFILE_LIST_COUNT_CACHE`` or
+    ``None`` when the amount of visible profiles shouldn't be cached.
+
+    """
+    if userena_settings.USERENA_PROFILE_LIST_COUNT_CACHE:
+        return get_cache(userena_settings.USERENA_PROFILE_LIST_COUNT_CACHE)
+    return None
+
+
+def clear_profile_counts():
+    """ Removes the cached amounts of visible profiles. """
+    cache = get_profile_count_cache()
+    if cache is not None:
+        cache.delete_many([PROFILE_COUNT_CACHE_KEY % audience
+                           for audience in ('anonymous', 'registered')])
+
+
+def estimate_count(queryset):
+    """
+    Returns the amount of rows the PostgreSQL planner expects ``queryset`` to
+    return, or ``None`` on other databases.
+
+    The estimate comes from ``EXPLAIN`` and is only as good as the statistics
+    of the tables, but it doesn't read the rows.
+
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    try:
+        cursor.execute('EXPLAIN %s' % sql, params)
+        plan = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    match = _EXPLAIN_ROWS.search(plan)
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+class CachedCountPage(Page):
+    """
+    Page of a :class:`CachedCountPaginator`. From the last counted page on
+    ``has_next`` tells if there are more objects than the count says.
+
+    """
+    def __init__(self, object_list, number, paginator, more=None):
+        super(CachedCountPage, self).__init__(object_list, number, paginator)
+        self.more = more
+
+    def has_next(self):
+        if self.more is not None:
+            return self.more
+        return super(CachedCountPage, self).has_next()
+
+    def next_page_number(self):
+        if self.more:
+            return self.number + 1
+        return super(CachedCountPage, self).next_page_number()
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator that doesn't count the objects on every request.
+
+    The count is read from the cache defined by
+    ``USERENA_PROFILE_LIST_COUNT_CACHE`` under ``cache_key``. When it isn't
+    cached and ``USERENA_PROFILE_LIST_ESTIMATE_COUNT`` is ``True`` the
+    planner estimate of PostgreSQL is used, otherwise the objects are counted.
+
+    Because the count may be too low, pages after the last counted page are
+    served as long as they hold objects, and from the last counted page on
+    one object more is fetched to know if there is a next page. When the
+    count is too high an empty page raises ``EmptyPage`` and the count is
+    removed from the cache.
+
+    """
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, cache_key=None):
+        super(CachedCountPaginator, self).__init__(
+            object_list, per_page, orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page)
+        self.cache_key = cache_key
+        self._cached_count = None
+
+    @property
+    def count(self):
+        if self._cached_count is not None:
+            return self._cached_count
+
+        count = None
+        cache = get_profile_count_cache() if self.cache_key else None
+        if cache is not None:
+            count = cache.get(self.cache_key)
+        if count is None:
+            if userena_settings.USERENA_PROFILE_LIST_ESTIMATE_COUNT:
+                count = estimate_count(self.object_list)
+            if count is None:
+                try:
+                    count = self.object_list.count()
+                except (AttributeError, TypeError):
+                    count = len(self.object_list)
+            if cache is not None:
+                cache.set(self.cache_key, count,
+                          userena_settings.USERENA_PROFILE_LIST_COUNT_TIMEOUT)
+        self._cached_count = count
+        return count
+
+    def validate_number(self, number):
+        try:
+            return super(CachedCountPaginator, self).validate_number(number)
+        except EmptyPage:
+            number = int(number)
+            # A page past the count is valid when it holds objects.
+            if number > 1:
+                bottom = (number - 1) * self.per_page
+                if list(self.object_list[bottom:bottom + 1]):
+                    return number
+            raise
+
+    def invalidate_count(self):
+        """ Forgets the count, also in the cache. """
+        self._cached_count = None
+        cache = get_profile_count_cache() if self.cache_key else None
+        if cache is not None:
+            cache.delete(self.cache_key)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if number < self.num_pages:
+            object_list = list(self.object_list[bottom:top])
+            more = None
+        else:
+            object_list = list(self.object_list[bottom:top + self.orphans + 1])
+            more = len(object_list) > self.per_page + self.orphans
+            if more:
+                object_list = object_list[:self.per_page]
+        # The count was too high, objects were deleted since it was cached.
+        if not object_list and number > 1:
+            self.invalidate_count()
+            raise EmptyPage('That page contains no results')
+        return CachedCountPage(object_list, number, self, more=more)
@@ -38,6 +38,18 @@ USERENA_ACTIVATION_RETRY = getattr(settings,
                                     'USERENA_ACTIVATION_RETRY',
                                     False)
 
+USERENA_SIGNED_TOKENS = getattr(settings,
+                                'USERENA_SIGNED_TOKENS',
+                                False)
+
+USERENA_CONDITIONAL_ACTIVATION = getattr(settings,
+                                         'USERENA_CONDITIONAL_ACTIVATION',
+                                         False)
+
+USERENA_KEY_GENERATOR = getattr(settings,
+                                'USERENA_KEY_GENERATOR',
+                                'userena.utils.random_key')
+
 USERENA_ACTIVATED = getattr(settings,
                             'USERENA_ACTIVATED',
                             'ALREADY_ACTIVATED')
@@ -89,6 +101,26 @@ USERENA_DISABLE_PROFILE_LIST = getattr(settings,
                                        'USERENA_DISABLE_PROFILE_LIST',
                                        False)
 
+USERENA_PROFILE_LIST_KEYSET = getattr(settings,
+                                      'USERENA_PROFILE_LIST_KEYSET',
+                                      False)
+
+USERENA_PROFILE_LIST_COUNT_CACHE = getattr(settings,
+                                           'USERENA_PROFILE_LIST_COUNT_CACHE',
+                                           None)
+
+USERENA_PROFILE_LIST_COUNT_TIMEOUT = getattr(settings,
+                                             'USERENA_PROFILE_LIST_COUNT_TIMEOUT',
+                                             300)
+
+USERENA_PROFILE_LIST_ESTIMATE_COUNT = getattr(settings,
+                                              'USERENA_PROFILE_LIST_ESTIMATE_COUNT',
+                                              False)
+
+USERENA_DENORMALIZED_VISIBILITY = getattr(settings,
+                                          'USERENA_DENORMALIZED_VISIBILITY',
+                                          False)
+
 USERENA_DISABLE_SIGNUP = getattr(settings,
                                  'USERENA_DISABLE_SIGNUP',
                                  False)
@@ -101,6 +133,10 @@ USERENA_LANGUAGE_FIELD = getattr(settings,
                                  'USERENA_LANGUAGE_FIELD',
                                  'language')
 
+USERENA_LANGUAGE_CACHE = getattr(settings,
+                                 'USERENA_LANGUAGE_CACHE',
+                                 None)
+
 USERENA_WITHOUT_USERNAMES = getattr(settings,
                                     'USERENA_WITHOUT_USERNAMES',
                                     False)
@@ -111,12 +147,20 @@ USERENA_PROFILE_DETAIL_TEMPLATE = getattr(
 USERENA_PROFILE_LIST_TEMPLATE = getattr(
     settings, 'USERENA_PROFILE_LIST_TEMPLATE', 'userena/profile_list.html')
 
+USERENA_READ_ONLY_PROFILES = getattr(settings,
+                                     'USERENA_READ_ONLY_PROFILES',
+                                     False)
+
 USERENA_HIDE_EMAIL = getattr(settings, 'USERENA_HIDE_EMAIL', False)
 
 USERENA_HTML_EMAIL = getattr(settings, 'USERENA_HTML_EMAIL', False)
 
 USERENA_USE_PLAIN_TEMPLATE = getattr(settings, 'USERENA_USE_PLAIN_TEMPLATE', not USERENA_HTML_EMAIL)
 
+USERENA_MAIL_DELIVERY = getattr(settings,
+                                'USERENA_MAIL_DELIVERY',
+                                'userena.mail.ImmediateDelivery')
+
 USERENA_REGISTER_PROFILE = getattr(settings, 'USERENA_REGISTER_PROFILE', True)
 
 USERENA_REGISTER_USER = getattr(settings, 'USERENA_REGISTER_USER', True)
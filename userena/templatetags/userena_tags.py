@@ -0,0 +1,19 @@
+from django import template
+
+from userena.managers import bulk_can_view
+
+register = template.Library()
+
+@register.filter
+def viewable_by(profiles, user):
+    """
+    Returns the profiles that ``user`` can view, checked for all profiles at
+    once with :func:`userena.managers.bulk_can_view`. Usage::
+
+        {% load userena_tags %}
+        {% for profile in profiles|viewable_by:request.user %}
+
+    """
+    profiles = list(profiles)
+    can_view = bulk_can_view(user, profiles)
+    return [profile for profile in profiles if can_view[profile.pk]]
@@ -9,5 +9,6 @@ if django.VERSION < (1, 6):
     from .tests_managers import *
     from .tests_middleware import *
     from .tests_models import *
+    from .tests_queries import *
     from .tests_utils import *
     from .tests_views import *
\ No newline at end of file
@@ -1,12 +1,12 @@
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
-from userena.models import UserenaBaseProfile
+from userena.models import UserenaBaseProfile, UserenaVisibilityMixin
 from userena.utils import user_model_label
 
 import datetime
 
-class Profile(UserenaBaseProfile):
+class Profile(UserenaBaseProfile, UserenaVisibilityMixin):
     """ Default profile """
     GENDER_CHOICES = (
         (1, _('Male')),
@@ -1,20 +1,40 @@
 # encoding: utf-8
 from __future__ import unicode_literals
 
+from django.core import mail
 from django.test import TestCase
-from django.core.management import call_command
+from django.core.management import call_command, CommandError
+from django.db import connection, IntegrityError
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
+from django.core.mail.backends import locmem
+from django.core.mail.backends.base import BaseEmailBackend
+from django.utils.six import StringIO
 
-from userena.models import UserenaSignup
+from userena.management.commands.check_permissions import split_range
+from userena.management.commands.create_lookup_indexes import lookup_indexes
+from userena.models import UserenaSignup, UserenaOutboxMessage
+from userena.mail import build_mail
 from userena.managers import ASSIGNED_PERMISSIONS
 from userena import settings as userena_settings
-from userena.utils import get_profile_model
+from userena.utils import get_profile_model, get_datetime_now
 
 from guardian.models import UserObjectPermission
 
 import datetime
+import django
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+try:
+    from unittest import skipUnless
+except ImportError:  # Python 2.6
+    from django.utils.unittest import skipUnless
 
 User = get_user_model()
 
@@ -42,6 +62,182 @@ class CleanExpiredTests(TestCase):
 
         self.assertEqual(User.objects.filter(username=self.user_info['username']).count(), 0)
 
+    def test_clean_expired_options(self):
+        """
+        ``clean_expired`` only counts users with ``dry_run`` and resumes after
+        the id given by ``since_id``.
+
+        """
+        users = []
+        for i in range(3):
+            user = UserenaSignup.objects.create_user('user%s' % i,
+                                                     'user%s@example.com' % i,
+                                                     'swordfish',
+                                                     send_email=False)
+            user.date_joined -= datetime.timedelta(days=userena_settings.USERENA_ACTIVATION_DAYS + 1)
+            user.save()
+            users.append(user)
+
+        out = StringIO()
+        call_command('clean_expired', dry_run=True, batch_size=2, stdout=out)
+        self.assertEqual(User.objects.filter(pk__in=[u.pk for u in users]).count(), 3)
+        self.assertIn('Found 3 expired users in total', out.getvalue())
+        self.assertIn('last id: %s' % users[1].pk, out.getvalue())
+
+        out = StringIO()
+        call_command('clean_expired', since_id=users[0].pk, max_rate=1000,
+                     stdout=out)
+        self.assertIn('Deleted 2 expired users in total', out.getvalue())
+        self.assertEqual(list(User.objects.filter(pk__in=[u.pk for u in users])),
+                         [users[0]])
+
+class SendActivationRemindersTests(TestCase):
+    def _signup(self, username, days_ago):
+        user = UserenaSignup.objects.create_user(username,
+                                                 '%s@example.com' % username,
+                                                 'swordfish',
+                                                 send_email=False)
+        user.date_joined -= datetime.timedelta(days=days_ago)
+        user.save()
+        return user
+
+    def test_send_activation_reminders(self):
+        """
+        Only users of which the activation expires within
+        ``USERENA_ACTIVATION_NOTIFY_DAYS`` get a reminder, and only once.
+
+        """
+        days = userena_settings.USERENA_ACTIVATION_DAYS
+        notify_days = userena_settings.USERENA_ACTIVATION_NOTIFY_DAYS
+        due = [self._signup('due%s' % i, days - notify_days + 1) for i in range(3)]
+        self._signup('recent', 0)
+        self._signup('expired', days + 1)
+
+        out = StringIO()
+        call_command('send_activation_reminders', dry_run=True, stdout=out)
+        self.assertIn('Found 3 reminders in total', out.getvalue())
+        self.assertEqual(len(mail.outbox), 0)
+
+        out = StringIO()
+        call_command('send_activation_reminders', batch_size=2, stdout=out)
+        self.assertIn('Sent 3 reminders in total', out.getvalue())
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         sorted(u.email for u in due))
+        self.assertIn(due[0].userena_signup.activation_key, mail.outbox[0].body)
+        self.assertEqual(UserenaSignup.objects.filter(
+            activation_notification_send=True).count(), 3)
+
+        call_command('send_activation_reminders', output=False)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_reminders_disabled(self):
+        """ Nothing is send when ``USERENA_ACTIVATION_NOTIFY`` is ``False`` """
+        days = userena_settings.USERENA_ACTIVATION_DAYS
+        self._signup('due', days - userena_settings.USERENA_ACTIVATION_NOTIFY_DAYS + 1)
+
+        userena_settings.USERENA_ACTIVATION_NOTIFY = False
+        try:
+            call_command('send_activation_reminders', output=False)
+        finally:
+            userena_settings.USERENA_ACTIVATION_NOTIFY = True
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class ImportUsersTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, filename, content):
+        path = os.path.join(self.directory, filename)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_import_csv(self):
+        path = self._write('users.csv',
+                           'username,email,password\n'
+                           'alice,alice@example.com,swordfish\n'
+                           'bob,bob@example.com,swordfish\n')
+        out = StringIO()
+        call_command('import_users', path, chunk_size=1, stdout=out)
+
+        self.assertIn('Imported 2 users', out.getvalue())
+        self.assertEqual(User.objects.filter(username__in=['alice', 'bob'],
+                                             is_active=False).count(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_import_jsonl(self):
+        path = self._write('users.json',
+                           '{"username": "alice", "email": "alice@example.com", "password": "swordfish"}\n'
+                           '\n')
+        call_command('import_users', path, format='jsonl', active=True,
+                     send_email=False, stdout=StringIO())
+
+        self.assertTrue(User.objects.get(username='alice').is_active)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_import_existing_usernames(self):
+        """ Existing and repeated usernames are skipped and reported """
+        User.objects.create_user('john', 'john@example.com', 'swordfish')
+        path = self._write('users.csv',
+                           'username,email,password\n'
+                           'john,john@example.com,swordfish\n'
+                           'alice,alice@example.com,swordfish\n'
+                           'alice,alice@example.org,swordfish\n')
+        out = StringIO()
+        call_command('import_users', path, send_email=False, stdout=out)
+
+        self.assertIn('Skipped existing usernames: john, alice', out.getvalue())
+        self.assertIn('Imported 1 users, rows read: 3', out.getvalue())
+        self.assertEqual(User.objects.get(username='alice').email,
+                         'alice@example.com')
+
+    def test_import_failing_chunk(self):
+        """
+        A failing chunk is rolled back and the error tells where to resume,
+        the committed chunks are kept.
+
+        """
+        path = self._write('users.csv',
+                           'username,email,password\n'
+                           'alice,alice@example.com,swordfish\n'
+                           'bob,bob@example.com,swordfish\n'
+                           'carol,carol@example.com,swordfish\n')
+        manager = UserenaSignup.objects
+        create_chunk = manager._bulk_create_chunk
+
+        def failing_chunk(chunk, active):
+            result = create_chunk(chunk, active)
+            if chunk[0]['username'] == 'bob':
+                raise IntegrityError('Duplicate email')
+            return result
+
+        manager._bulk_create_chunk = failing_chunk
+        out = StringIO()
+        try:
+            self.assertRaisesRegexp(CommandError,
+                                    'Importing the rows from 2 on failed: '
+                                    'Duplicate email\nImported 1 users, rerun '
+                                    'with --skip-rows 1 to resume',
+                                    call_command, 'import_users', path,
+                                    chunk_size=1, send_email=False, stdout=out)
+        finally:
+            del manager._bulk_create_chunk
+
+        self.assertIn('Imported 1 users, rows read: 1', out.getvalue())
+        self.assertEqual(list(User.objects.filter(
+            username__in=['alice', 'bob', 'carol'])
+            .values_list('username', flat=True)), ['alice'])
+
+        call_command('import_users', path, skip_rows=1, send_email=False,
+                     stdout=out)
+        self.assertIn('Imported 2 users, rows read: 3', out.getvalue())
+        self.assertEqual(User.objects.filter(
+            username__in=['alice', 'bob', 'carol']).count(), 3)
+
 class CheckPermissionTests(TestCase):
     user_info = {'username': 'alice',
                  'password': 'swordfish',
@@ -71,6 +267,76 @@ class CheckPermissionTests(TestCase):
         # Check it again should do nothing
         call_command('check_permissions', test=True)
 
+    def test_check_permissions_dry_run(self):
+        """ A dry run reports the missing permissions without adding them """
+        user = UserenaSignup.objects.create_user(**self.user_info)
+        UserObjectPermission.objects.filter(user=user,
+                                            permission__codename='change_user').delete()
+
+        out = StringIO()
+        call_command('check_permissions', dry_run=True, stdout=out)
+
+        self.assertIn('Missing permissions for user: alice (change_user)', out.getvalue())
+        self.assertIn('Missing 0 permissions, 1 object permissions for 1 users', out.getvalue())
+        self.assertFalse(UserObjectPermission.objects.filter(
+            user=user, permission__codename='change_user').exists())
+
+        out = StringIO()
+        call_command('check_permissions', chunk_size=1, stdout=out)
+
+        self.assertIn('Added 0 permissions, 1 object permissions for 1 users', out.getvalue())
+        self.assertTrue(UserObjectPermission.objects.filter(
+            user=user, permission__codename='change_user').exists())
+
+    def test_check_permissions_shard(self):
+        """ Only the users in the given part of the ids are checked """
+        alice = UserenaSignup.objects.create_user(**self.user_info)
+        bob = UserenaSignup.objects.create_user('bob', 'bob@example.com', 'swordfish')
+        UserObjectPermission.objects.filter(user__in=[alice, bob]).delete()
+
+        call_command('check_permissions', shard='2/2', stdout=StringIO())
+
+        self.assertEqual(UserObjectPermission.objects.filter(user=alice).count(), 0)
+        self.assertEqual(UserObjectPermission.objects.filter(user=bob).count(), 5)
+
+    @skipUnless(hasattr(multiprocessing, 'get_context') and django.VERSION >= (1, 7),
+                "Needs the 'spawn' start method and django.setup()")
+    def test_check_permissions_workers(self):
+        """
+        Workers started with ``spawn`` repair the permissions of a file backed
+        database.
+
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, 'worker_settings.py'), 'w') as f:
+                f.write(WORKER_SETTINGS % os.path.join(directory, 'workers.db'))
+            env = dict(os.environ,
+                       DJANGO_SETTINGS_MODULE='worker_settings',
+                       PYTHONPATH=os.pathsep.join(
+                           [directory] + [path for path in sys.path if path]))
+            process = subprocess.Popen([sys.executable, '-c', WORKER_SCRIPT],
+                                       env=env, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
+            try:
+                # A pool of workers that can't start hangs.
+                output = process.communicate(timeout=120)[0].decode('utf-8')
+            except subprocess.TimeoutExpired:
+                process.kill()
+                output = process.communicate()[0].decode('utf-8')
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(process.returncode, 0, output)
+        self.assertIn('Added 0 permissions, 50 object permissions for 10 users',
+                      output)
+        self.assertIn('repaired: 50', output)
+
+    def test_split_range(self):
+        self.assertEqual(split_range(1, 10, 3), [(1, 4), (5, 8), (9, 10)])
+        self.assertEqual(split_range(5, 6, 4), [(5, 5), (6, 6)])
+        self.assertEqual(split_range(7, 7, 1), [(7, 7)])
+
     def test_incomplete_permissions(self):
         # Delete the neccesary permissions
         profile_model_obj = get_profile_model()
@@ -123,3 +389,139 @@ class CheckPermissionTests(TestCase):
         # run the command to check for the warning.
         call_command('check_permissions', test=True)
 
+
+
+WORKER_SETTINGS = """
+from userena.runtests.settings import *
+DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3',
+                         'NAME': %r}}
+"""
+
+WORKER_SCRIPT = """
+import multiprocessing
+import django
+django.setup()
+
+from django.core.management import call_command
+from guardian.models import UserObjectPermission
+from userena.models import UserenaSignup
+
+# Apps without migrations are only synced on request since Django 1.9.
+call_command('migrate', verbosity=0,
+             **({'run_syncdb': True} if django.VERSION >= (1, 9) else {}))
+UserenaSignup.objects.bulk_create_users(
+    ({'username': 'user%d' % i, 'email': 'user%d@example.com' % i,
+      'password': 'swordfish'} for i in range(10)), send_email=False)
+UserObjectPermission.objects.all().delete()
+
+multiprocessing.set_start_method('spawn')
+call_command('check_permissions', workers=2)
+print('repaired: %d' % UserObjectPermission.objects.count())
+"""
+
+
+class CreateLookupIndexesTests(TestCase):
+    def test_lookup_indexes(self):
+        """ Indexes are built on the expression used by ``__iexact`` """
+        table = connection.ops.quote_name(User._meta.db_table)
+        self.assertEqual(lookup_indexes(connection), [
+            ('userena_auth_user_upper_username',
+             '%s (UPPER("username"::text))' % table),
+            ('userena_auth_user_upper_email',
+             '%s (UPPER("email"::text))' % table)])
+
+    def test_other_databases(self):
+        """ Only PostgreSQL needs the indexes """
+        out = StringIO()
+        call_command('create_lookup_indexes', stdout=out)
+        if connection.vendor != 'postgresql':
+            self.assertIn('Nothing to do for %s' % connection.vendor,
+                          out.getvalue())
+
+
+class CheckVisibilityTests(TestCase):
+    fixtures = ['users', 'profiles']
+
+    def test_check_visibility(self):
+        """ The command counts and repairs profiles with a wrong visibility """
+        wrong = get_profile_model().objects.inconsistent_visibility().count()
+        self.assertTrue(wrong > 0)
+
+        out = StringIO()
+        call_command('check_visibility', dry_run=True, stdout=out)
+        self.assertIn('Found %d profiles' % wrong, out.getvalue())
+
+        out = StringIO()
+        call_command('check_visibility', stdout=out)
+        self.assertIn('Repaired %d profiles' % wrong, out.getvalue())
+        self.assertFalse(
+            get_profile_model().objects.inconsistent_visibility().exists())
+
+
+class SendMailTests(TestCase):
+    def _queue(self, count):
+        UserenaOutboxMessage.objects.bulk_create([
+            UserenaOutboxMessage.from_message(
+                build_mail('Subject %d' % i, 'Body', None,
+                           'webmaster@example.com', ['user%d@example.com' % i]))
+            for i in range(count)])
+
+    def test_send_mail(self):
+        """ All due messages are send and removed from the outbox """
+        self._queue(3)
+        out = StringIO()
+        call_command('userena_send_mail', batch_size=2, stdout=out)
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(UserenaOutboxMessage.objects.count(), 0)
+        self.assertIn('Sent 2 messages, 0 failed.', out.getvalue())
+
+    def test_send_mail_overlapping(self):
+        """ Messages claimed by a running worker aren't send by another """
+        self._queue(3)
+        with self.settings(EMAIL_BACKEND='userena.tests.test_commands.OverlappingBackend'):
+            sent = UserenaOutboxMessage.objects.send_pending()
+
+        self.assertEqual(sent, (3, 0))
+        self.assertEqual(OverlappingBackend.overlapping, (0, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(UserenaOutboxMessage.objects.count(), 0)
+
+    def test_send_mail_failure(self):
+        """ Failed messages stay in the outbox and are retried later """
+        self._queue(1)
+        with self.settings(EMAIL_BACKEND='userena.tests.test_commands.FailingBackend'):
+            call_command('userena_send_mail', backoff=30, output=False)
+
+        message = UserenaOutboxMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(message.last_error, 'mail server down')
+        self.assertTrue(message.next_attempt > get_datetime_now() +
+                        datetime.timedelta(seconds=25))
+
+        # Not due yet, so nothing is send.
+        call_command('userena_send_mail', output=False)
+        self.assertEqual(len(mail.outbox), 0)
+
+        message.next_attempt = get_datetime_now()
+        message.save()
+        call_command('userena_send_mail', output=False)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(UserenaOutboxMessage.objects.count(), 0)
+
+
+class OverlappingBackend(locmem.EmailBackend):
+    """ Runs a second worker while the first one sends its messages. """
+    overlapping = None
+
+    def send_messages(self, email_messages):
+        if OverlappingBackend.overlapping is None:
+            OverlappingBackend.overlapping = ()
+            OverlappingBackend.overlapping = \
+                UserenaOutboxMessage.objects.send_pending()
+        return super(OverlappingBackend, self).send_messages(email_messages)
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise IOError('mail server down')
@@ -2,11 +2,13 @@
 from __future__ import unicode_literals
 
 from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save
 from django.test import TestCase
 from django.utils.translation import ugettext_lazy as _, override
 
 from userena import forms
 from userena import settings as userena_settings
+from userena.utils import get_user_profile
 
 
 class SignupFormTests(TestCase):
@@ -213,4 +215,28 @@ class ChangeEmailFormTests(TestCase):
 
 class EditAccountFormTest(TestCase):
     """ Test the ``EditAccountForm`` """
-    pass
+    fixtures = ['users', 'profiles']
+
+    def test_save_user_columns(self):
+        """ Only the name of the user is written, not the whole row """
+        user = get_user_model().objects.get(pk=1)
+        form = forms.EditProfileForm(instance=get_user_profile(user=user),
+                                     data={'first_name': 'Alice',
+                                           'last_name': 'Liddell',
+                                           'privacy': 'open'})
+        self.assertTrue(form.is_valid())
+
+        user_saves = []
+
+        def receiver(sender, update_fields=None, **kwargs):
+            user_saves.append(update_fields)
+
+        pre_save.connect(receiver, sender=get_user_model())
+        try:
+            form.save()
+        finally:
+            pre_save.disconnect(receiver, sender=get_user_model())
+        self.assertEqual(user_saves, [frozenset(['first_name', 'last_name'])])
+
+        user = get_user_model().objects.get(pk=1)
+        self.assertEqual((user.first_name, user.last_name), ('Alice', 'Liddell'))
@@ -1,10 +1,16 @@
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import pre_save
 from django.test import TestCase
 
+from userena.managers import get_assigned_permissions, uses_visibility
 from userena.models import UserenaSignup
+from userena.tests.profiles.models import Profile, SecondProfile
 from userena import settings as userena_settings
-from userena.utils import get_user_profile
+from userena.utils import get_user_profile, get_profile_model
 
+from guardian.models import UserObjectPermission
 from guardian.shortcuts import get_perms
 
 import datetime, re
@@ -50,6 +56,98 @@ class UserenaManagerTests(TestCase):
         # User should be saved
         self.assertEqual(User.objects.filter(email=self.user_info['email']).count(), 1)
 
+    def test_create_user_permissions(self):
+        """
+        All permissions of a new user are written at once, the permission
+        rows are only looked up once per process.
+
+        """
+        UserenaSignup.objects.create_user('bob', 'bob@example.com', 'swordfish',
+                                          send_email=False)
+
+        with self.assertNumQueries(7):
+            new_user = UserenaSignup.objects.create_user(**self.user_info)
+        profile = get_user_profile(user=new_user)
+
+        permissions = UserObjectPermission.objects.filter(user=new_user)
+        self.assertEqual(set(permissions.filter(object_pk=profile.pk)
+                             .values_list('permission__codename', flat=True)),
+                         set(['view_profile', 'change_profile', 'delete_profile']))
+        self.assertEqual(set(permissions.filter(object_pk=new_user.pk)
+                             .values_list('permission__codename', flat=True)),
+                         set(['change_user', 'delete_user']))
+
+    def test_bulk_create_users(self):
+        """
+        ``bulk_create_users`` creates users with a profile, permissions and
+        activation key in a fixed amount of queries per chunk.
+
+        """
+        users = [{'username': 'user%s' % i,
+                  'email': 'user%s@example.com' % i,
+                  'password': 'swordfish'} for i in range(5)]
+        get_assigned_permissions('profile')
+        get_assigned_permissions('user')
+
+        # Seven queries and a savepoint per chunk.
+        with self.assertNumQueries(18):
+            created = UserenaSignup.objects.bulk_create_users(
+                iter(users), send_email=False, chunk_size=3)
+        self.assertEqual(created, 5)
+
+        for data in users:
+            user = User.objects.get(username=data['username'])
+            self.assertFalse(user.is_active)
+            self.assertTrue(user.check_password('swordfish'))
+            self.assertTrue(re.match('^[a-f0-9]{40}$', user.userena_signup.activation_key))
+            profile = get_user_profile(user=user)
+            self.assertEqual(UserObjectPermission.objects.filter(user=user,
+                                                                 object_pk=profile.pk).count(), 3)
+            self.assertEqual(UserObjectPermission.objects.filter(user=user,
+                                                                 object_pk=user.pk).count(), 2)
+
+    def test_bulk_create_users_visibility(self):
+        """ Bulk created profiles get their visibility without ``pre_save`` """
+        users = [{'username': 'user%s' % i,
+                  'email': 'user%s@example.com' % i,
+                  'password': 'swordfish'} for i in range(3)]
+        userena_settings.USERENA_DENORMALIZED_VISIBILITY = True
+        try:
+            UserenaSignup.objects.bulk_create_users(users, active=True,
+                                                    send_email=False)
+            visible = get_profile_model().objects.get_visible_profiles(
+                User.objects.get(pk=1)).filter(user__username__startswith='user')
+            self.assertEqual(visible.count(), 3)
+        finally:
+            userena_settings.USERENA_DENORMALIZED_VISIBILITY = False
+
+    def test_uses_visibility(self):
+        """
+        The visibility is only used by profile models with the mixin, the
+        manager of the model isn't needed to tell.
+
+        """
+        self.assertFalse(uses_visibility(Profile))
+        userena_settings.USERENA_DENORMALIZED_VISIBILITY = True
+        try:
+            self.assertTrue(uses_visibility(Profile))
+            self.assertFalse(uses_visibility(SecondProfile))
+            self.assertFalse(uses_visibility(User))
+        finally:
+            userena_settings.USERENA_DENORMALIZED_VISIBILITY = False
+
+    def test_missing_assigned_permissions(self):
+        """ New users don't silently get fewer permissions """
+        Permission.objects.get(
+            codename='delete_profile',
+            content_type=ContentType.objects.get_for_model(get_profile_model())).delete()
+        self.assertRaises(Permission.DoesNotExist,
+                          UserenaSignup.objects.create_user,
+                          **self.user_info)
+        content_type, permissions = get_assigned_permissions('profile',
+                                                             strict=False)
+        self.assertEqual(len(permissions), 2)
+
     def test_activation_valid(self):
         """
         Valid activation of an user.
@@ -77,6 +175,36 @@ class UserenaManagerTests(TestCase):
         self.assertEqual(active_user.userena_signup.activation_key,
                          userena_settings.USERENA_ACTIVATED)
 
+    def test_activation_queries(self):
+        """ Activation fetches the signup with its user in one query """
+        user = UserenaSignup.objects.create_user(**self.user_info)
+        # One select and an update of the signup and the user.
+        with self.assertNumQueries(3):
+            UserenaSignup.objects.activate_user(user.userena_signup.activation_key)
+        self.assertTrue(User.objects.get(pk=user.pk).is_active)
+
+    def test_conditional_activation(self):
+        """
+        With ``USERENA_CONDITIONAL_ACTIVATION`` only one of two simultaneous
+        activations succeeds.
+
+        """
+        user = UserenaSignup.objects.create_user(**self.user_info)
+        key = user.userena_signup.activation_key
+        first = UserenaSignup.objects.get_by_activation_key(key)
+        second = UserenaSignup.objects.get_by_activation_key(key)
+
+        userena_settings.USERENA_CONDITIONAL_ACTIVATION = True
+        try:
+            self.assertEqual(UserenaSignup.objects.activate_signup(first), user)
+            self.assertFalse(UserenaSignup.objects.activate_signup(second))
+        finally:
+            userena_settings.USERENA_CONDITIONAL_ACTIVATION = False
+
+        self.assertTrue(User.objects.get(pk=user.pk).is_active)
+        self.assertEqual(UserenaSignup.objects.get(pk=first.pk).activation_key,
+                         userena_settings.USERENA_ACTIVATED)
+
     def test_activation_invalid(self):
         """
         Activation with a key that's invalid should make
@@ -161,7 +289,247 @@ class UserenaManagerTests(TestCase):
 
         deleted_users = UserenaSignup.objects.delete_expired_users()
 
-        self.assertEqual(deleted_users[0].username, 'alice')
+        self.assertEqual(deleted_users, 1)
+        self.assertFalse(User.objects.filter(username='alice').exists())
+
+    def test_delete_expired_users_in_batches(self):
+        """
+        Expired users are deleted in chunks, skipping active users and users
+        whose activation period has not ended yet.
+
+        """
+        expired_date = datetime.timedelta(days=userena_settings.USERENA_ACTIVATION_DAYS + 1)
+        expired_ids = []
+        for i in range(3):
+            user = UserenaSignup.objects.create_user('expired%s' % i,
+                                                     'expired%s@example.com' % i,
+                                                     'swordfish',
+                                                     send_email=False)
+            user.date_joined -= expired_date
+            user.save()
+            expired_ids.append(user.pk)
+        UserenaSignup.objects.create_user(**self.user_info)
+
+        batches = list(UserenaSignup.objects.delete_expired_users_in_batches(batch_size=2))
+
+        self.assertEqual(batches, [(expired_ids[1], 2), (expired_ids[2], 1)])
+        self.assertFalse(User.objects.filter(pk__in=expired_ids).exists())
+        self.assertTrue(User.objects.filter(username='alice').exists())
+
+        # Resuming after the last id should not find anything.
+        expired_user = User.objects.get(username='alice')
+        expired_user.date_joined -= expired_date
+        expired_user.save()
+        self.assertEqual(list(UserenaSignup.objects.delete_expired_users_in_batches(
+            since_id=expired_user.pk)), [])
+
+    def test_send_activation_reminders(self):
+        """
+        Every batch of reminders is selected with one query and marked with
+        one ``UPDATE``.
+
+        """
+        remind_date = datetime.timedelta(days=userena_settings.USERENA_ACTIVATION_DAYS -
+                                         userena_settings.USERENA_ACTIVATION_NOTIFY_DAYS + 1)
+        for i in range(3):
+            user = UserenaSignup.objects.create_user('remind%s' % i,
+                                                     'remind%s@example.com' % i,
+                                                     'swordfish',
+                                                     send_email=False)
+            user.date_joined -= remind_date
+            user.save()
+
+        # Warm the site cache.
+        list(UserenaSignup.objects.send_activation_reminders(dry_run=True))
+        # Two batches of a select and an update, and the final empty select.
+        with self.assertNumQueries(5):
+            batches = list(UserenaSignup.objects.send_activation_reminders(batch_size=2))
+        self.assertEqual([count for count, seconds in batches], [2, 1])
+        self.assertFalse(UserenaSignup.objects.reminder_signups().exists())
+
+
+class UserenaSignedTokensTests(TestCase):
+    """ Activation and confirmation with ``USERENA_SIGNED_TOKENS`` """
+    user_info = {'username': 'alice',
+                 'password': 'swordfish',
+                 'email': 'alice@example.com'}
+
+    def setUp(self):
+        userena_settings.USERENA_SIGNED_TOKENS = True
+
+    def tearDown(self):
+        userena_settings.USERENA_SIGNED_TOKENS = False
+
+    def test_activation_token(self):
+        """ A signed token activates the user once """
+        user = UserenaSignup.objects.create_user(**self.user_info)
+        token = user.userena_signup.get_activation_key()
+        self.assertNotEqual(token, user.userena_signup.activation_key)
+
+        # Invalid tokens are rejected without a query.
+        with self.assertNumQueries(0):
+            self.assertFalse(UserenaSignup.objects.activate_user(token + 'x'))
+
+        active_user = UserenaSignup.objects.activate_user(token)
+        self.assertEqual(active_user, user)
+        self.assertTrue(active_user.is_active)
+        self.assertFalse(UserenaSignup.objects.activate_user(token))
+
+    def test_stored_keys(self):
+        """ Keys mailed before the tokens were enabled keep working """
+        userena_settings.USERENA_SIGNED_TOKENS = False
+        user = UserenaSignup.objects.create_user(**self.user_info)
+        signup = user.userena_signup
+        activation_key = signup.get_activation_key()
+        signup.change_email('alice@newexample.com')
+        confirmation_key = signup.get_confirmation_key()
+        userena_settings.USERENA_SIGNED_TOKENS = True
+
+        self.assertEqual(UserenaSignup.objects.activate_user(activation_key),
+                         user)
+        self.assertEqual(
+            UserenaSignup.objects.confirm_email(confirmation_key).email,
+            'alice@newexample.com')
+
+    def test_expired_activation_token(self):
+        """ Tokens older than ``USERENA_ACTIVATION_DAYS`` are rejected """
+        user = UserenaSignup.objects.create_user(**self.user_info)
+        token = user.userena_signup.get_activation_key()
+
+        activation_days = userena_settings.USERENA_ACTIVATION_DAYS
+        userena_settings.USERENA_ACTIVATION_DAYS = -1
+        try:
+            with self.assertNumQueries(0):
+                self.assertFalse(UserenaSignup.objects.activate_user(token))
+            self.assertTrue(UserenaSignup.objects.check_expired_activation(token))
+        finally:
+            userena_settings.USERENA_ACTIVATION_DAYS = activation_days
+
+    def test_confirmation_token(self):
+        """ A signed token only confirms the email address it was made for """
+        user = UserenaSignup.objects.create_user(**self.user_info)
+        signup = user.userena_signup
+        signup.change_email('alice@newexample.com')
+        old_token = signup.get_confirmation_key()
+
+        signup.change_email('alice@otherexample.com')
+        token = signup.get_confirmation_key()
+        self.assertFalse(UserenaSignup.objects.confirm_email(old_token))
+        # Tokens are bound to their purpose.
+        self.assertFalse(UserenaSignup.objects.confirm_email(
+            signup.get_activation_key()))
+
+        confirmed_user = UserenaSignup.objects.confirm_email(token)
+        self.assertEqual(confirmed_user.email, 'alice@otherexample.com')
+        self.assertFalse(UserenaSignup.objects.confirm_email(token))
+
+
+class WrittenFields(object):
+    """
+    Collects the fields written by ``save`` per table, read from the
+    ``update_fields`` the ``pre_save`` signal receives. Inserts are ignored.
+
+    """
+    def __enter__(self):
+        self.fields = {}
+        pre_save.connect(self.receiver)
+        return self.fields
+
+    def __exit__(self, *exc_info):
+        pre_save.disconnect(self.receiver)
+
+    def receiver(self, sender, instance, update_fields=None, **kwargs):
+        if instance.pk is None:
+            return
+        if update_fields is None:
+            update_fields = [field.name for field in sender._meta.local_fields
+                             if not field.primary_key]
+        self.fields.setdefault(sender._meta.db_table, set()).update(update_fields)
+
+
+class UserenaUpdateFieldsTests(TestCase):
+    """ Only the changed columns are written """
+    user_info = {'username': 'alice',
+                 'password': 'swordfish',
+                 'email': 'alice@example.com'}
+
+    def assertWrites(self, fields, func, *args):
+        with WrittenFields() as written:
+            func(*args)
+        self.assertEqual(written, fields)
+
+    def test_written_columns(self):
+        user_table = User._meta.db_table
+        signup_table = UserenaSignup._meta.db_table
+
+        self.assertWrites({user_table: set(['is_active'])},
+                          UserenaSignup.objects.create_user,
+                          'alice', 'alice@example.com', 'swordfish')
+        signup = UserenaSignup.objects.get(user__username='alice')
+
+        signup.user.date_joined -= datetime.timedelta(
+            days=userena_settings.USERENA_ACTIVATION_DAYS + 1)
+        signup.user.save()
+        self.assertWrites({user_table: set(['date_joined']),
+                           signup_table: set(['activation_key'])},
+                          UserenaSignup.objects.reissue_activation,
+                          signup.activation_key)
+
+        signup = UserenaSignup.objects.get(pk=signup.pk)
+        self.assertWrites({user_table: set(['is_active']),
+                           signup_table: set(['activation_key'])},
+                          UserenaSignup.objects.activate_user,
+                          signup.activation_key)
+
+        signup = UserenaSignup.objects.get(pk=signup.pk)
+        self.assertWrites({signup_table: set(['email_unconfirmed',
+                                              'email_confirmation_key',
+                                              'email_confirmation_key_created'])},
+                          signup.change_email, 'alice@newexample.com')
+
+        self.assertWrites({user_table: set(['email']),
+                           signup_table: set(['email_unconfirmed',
+                                              'email_confirmation_key'])},
+                          UserenaSignup.objects.confirm_email,
+                          signup.email_confirmation_key)
+
+
+class UserenaCheckPermissionsTests(TestCase):
+    """ Test ``UserenaManager.check_permissions`` """
+    user_info = {'username': 'alice',
+                 'password': 'swordfish',
+                 'email': 'alice@example.com'}
+
+    def test_check_permissions(self):
+        """
+        Missing permissions are repaired with a fixed amount of queries per
+        chunk of users.
+
+        """
+        user = UserenaSignup.objects.create_user(**self.user_info)
+        UserenaSignup.objects.create_user('bob', 'bob@example.com', 'swordfish')
+        profile = get_user_profile(user=user)
+        UserObjectPermission.objects.filter(user=user).delete()
+
+        # Two queries for the permissions, three per chunk of users, one
+        # insert for the missing permissions and one to find the end.
+        with self.assertNumQueries(10):
+            permissions, users, warnings = UserenaSignup.objects.check_permissions(
+                chunk_size=1)
+
+        self.assertEqual(permissions, [])
+        self.assertEqual(warnings, [])
+        self.assertEqual(len(users), 1)
+        self.assertEqual(users[0][0], 'alice')
+        self.assertEqual(set(users[0][1]),
+                         set(['view_profile', 'change_profile', 'delete_profile',
+                              'change_user', 'delete_user']))
+        self.assertEqual(UserObjectPermission.objects.filter(
+            user=user, object_pk=profile.pk,
+            content_type=ContentType.objects.get_for_model(profile)).count(), 3)
+
+        # Nothing to repair anymore.
+        self.assertEqual(UserenaSignup.objects.check_permissions()[1], [])
 
 
 class UserenaManagersIssuesTests(TestCase):
@@ -3,7 +3,8 @@ from django.http import HttpRequest
 from django.test import TestCase
 
 from userena.tests.profiles.models import Profile
-from userena.middleware import UserenaLocaleMiddleware
+from userena.middleware import UserenaLocaleMiddleware, get_language_cache
+from userena.signals import profile_change
 from userena import settings as userena_settings
 from userena.utils import get_user_profile, get_profile_model
 
@@ -86,3 +87,36 @@ class UserenaLocaleMiddlewareTests(TestCase):
         # Middleware should do nothing
         UserenaLocaleMiddleware().process_request(req)
         self.assertFalse(hasattr(req, 'LANGUAGE_CODE'))
+
+    def test_language_cache(self):
+        """ The language is cached per user until the profile changes """
+        userena_settings.USERENA_LANGUAGE_CACHE = 'default'
+        try:
+            user = User.objects.get(pk=1)
+            get_language_cache().clear()
+
+            UserenaLocaleMiddleware().process_request(self._get_request_with_user(user))
+
+            req = self._get_request_with_user(user)
+            with self.assertNumQueries(0):
+                UserenaLocaleMiddleware().process_request(req)
+            self.assertEqual(req.LANGUAGE_CODE, 'nl')
+
+            # Saving the profile clears the cache.
+            profile = get_user_profile(user=user)
+            profile.language = 'fr'
+            profile.save()
+
+            req = self._get_request_with_user(user)
+            UserenaLocaleMiddleware().process_request(req)
+            self.assertEqual(req.LANGUAGE_CODE, 'fr')
+
+            # So does the ``profile_change`` signal.
+            Profile.objects.filter(pk=profile.pk).update(language='en')
+            profile_change.send(sender=None, user=user)
+
+            req = self._get_request_with_user(User.objects.get(pk=1))
+            UserenaLocaleMiddleware().process_request(req)
+            self.assertEqual(req.LANGUAGE_CODE, 'en')
+        finally:
+            userena_settings.USERENA_LANGUAGE_CACHE = None
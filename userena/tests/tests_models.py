@@ -3,23 +3,40 @@ import hashlib
 import re
 
 from django.contrib.auth import get_user_model
-from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.models import AnonymousUser, Group
 from django.core import mail
+from django.core.mail.backends import locmem
 from django.conf import settings
+from django.db import connection
+from django.template import Context, Template
 from django.test import TestCase
 from django.utils.six import text_type
 from django.utils.six.moves.urllib_parse import urlparse, parse_qs
 
-from userena.models import UserenaSignup, upload_to_mugshot
+from userena.mail import UserenaConfirmationMail, build_mail, send_mass_mail
+from userena.managers import bulk_can_view
+from userena.models import UserenaSignup, UserenaOutboxMessage, upload_to_mugshot
 from userena import settings as userena_settings
-from userena.tests.profiles.models import Profile
+from userena import signals as userena_signals
+from userena.tests.profiles.models import Profile, SecondProfile
 from userena.utils import get_user_profile
 
+from guardian.shortcuts import assign_perm
+
 User = get_user_model()
 
 MUGSHOT_RE = re.compile('^[a-f0-9]{40}$')
 
 
+class CountingBackend(locmem.EmailBackend):
+    """ Counts the connections that are created. """
+    instances = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingBackend.instances += 1
+        super(CountingBackend, self).__init__(*args, **kwargs)
+
+
 class UserenaSignupModelTests(TestCase):
     """ Test the model of UserenaSignup """
     user_info = {'username': 'alice',
@@ -62,6 +79,39 @@ class UserenaSignupModelTests(TestCase):
         """ TODO """
         pass
 
+    def test_confirmation_email_connection(self):
+        """
+        The emails to the old and the new address are send over one
+        connection.
+
+        """
+        signup = UserenaSignup.objects.get(pk=1)
+        CountingBackend.instances = 0
+        with self.settings(EMAIL_BACKEND='userena.tests.tests_models.CountingBackend'):
+            signup.change_email('new@example.com')
+
+        self.assertEqual(CountingBackend.instances, 1)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[1].to, ['new@example.com'])
+
+    def test_send_mass_mail(self):
+        """ ``send_mass_mail`` returns the amount of messages and the timing """
+        messages = [build_mail('Subject', 'Body', None, 'webmaster@example.com',
+                               ['user%d@example.com' % i]) for i in range(3)]
+        sent, seconds = send_mass_mail(messages)
+
+        self.assertEqual(sent, 3)
+        self.assertTrue(seconds >= 0)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(send_mass_mail([])[0], 0)
+
+    def test_key_indexes(self):
+        """ The activation and confirmation keys are looked up by an index """
+        indexes = connection.introspection.get_indexes(
+            connection.cursor(), UserenaSignup._meta.db_table)
+        self.assertIn('activation_key', indexes)
+        self.assertIn('email_confirmation_key', indexes)
+
     def test_activation_expired_account(self):
         """
         ``UserenaSignup.activation_key_expired()`` is ``True`` when the
@@ -157,6 +207,47 @@ class UserenaSignupModelTests(TestCase):
         self.assertTrue(text_type(mail.outbox[0].message()).find("<p>Thank you for signing up")>-1)
         self.assertTrue(mail.outbox[0].body.find("Thank you for signing up")>-1)
 
+    def test_outbox_delivery(self):
+        """
+        With the ``OutboxDelivery`` the activation email is stored and only
+        send by ``UserenaOutboxMessage.objects.send_pending``.
+
+        """
+        userena_settings.USERENA_MAIL_DELIVERY = 'userena.mail.OutboxDelivery'
+        userena_settings.USERENA_HTML_EMAIL = True
+        try:
+            UserenaSignup.objects.create_user(**self.user_info)
+        finally:
+            userena_settings.USERENA_MAIL_DELIVERY = 'userena.mail.ImmediateDelivery'
+            userena_settings.USERENA_HTML_EMAIL = False
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(UserenaOutboxMessage.objects.count(), 1)
+
+        self.assertEqual(UserenaOutboxMessage.objects.send_pending(), (1, 0))
+        self.assertEqual(UserenaOutboxMessage.objects.count(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.user_info['email']])
+        self.assertTrue(text_type(mail.outbox[0].message()).find("text/html")>-1)
+
+    def test_mail_templates_cached(self):
+        """ Templates are compiled once and shared between the recipients """
+        mailer = UserenaConfirmationMail(context={'site': {'name': 'example.com'},
+                                                  'protocol': 'http'})
+        templates = mailer.get_templates('activation')
+        self.assertTrue(mailer.get_templates('activation') is templates)
+
+        users = User.objects.filter(pk__in=[1, 2]).order_by('pk')
+        messages = mailer.build_messages(
+            'activation',
+            [({'user': user, 'activation_key': 'key%d' % user.pk}, user.email)
+             for user in users])
+
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(messages[1].to, [users[1].email])
+        self.assertTrue('key%d' % users[1].pk in messages[1].body)
+        self.assertEqual(messages[0].subject, messages[1].subject)
+
 class BaseProfileModelTest(TestCase):
     """ Test the ``BaseProfile`` model """
     fixtures = ['users', 'profiles']
@@ -242,6 +333,24 @@ class BaseProfileModelTest(TestCase):
         userena_settings.USERENA_MUGSHOT_SIZE = 80
         userena_settings.USERENA_MUGSHOT_DEFAULT = 'identicon'
 
+    def test_get_mugshot_urls(self):
+        """ The mugshots of many profiles are the same as one by one """
+        profiles = list(Profile.objects.select_related('user'))
+        profiles[0].mugshot = 'mugshots/john.png'
+
+        try:
+            for gravatar, default in ((True, 'identicon'),
+                                      (False, 'http://example.com'),
+                                      (False, 'identicon')):
+                userena_settings.USERENA_MUGSHOT_GRAVATAR = gravatar
+                userena_settings.USERENA_MUGSHOT_DEFAULT = default
+                self.assertEqual(Profile.get_mugshot_urls(profiles),
+                                 [profile.get_mugshot_url()
+                                  for profile in profiles])
+        finally:
+            userena_settings.USERENA_MUGSHOT_GRAVATAR = True
+            userena_settings.USERENA_MUGSHOT_DEFAULT = 'identicon'
+
     def test_get_full_name_or_username(self):
         """ Test if the full name or username are returned correcly """
         user = User.objects.get(pk=1)
@@ -292,3 +401,83 @@ class BaseProfileModelTest(TestCase):
         self.assertFalse(profile.can_view_profile(anon_user))
         self.assertTrue(profile.can_view_profile(super_user))
         self.assertFalse(profile.can_view_profile(reg_user))
+
+    def test_bulk_can_view(self):
+        """ ``bulk_can_view`` agrees with ``can_view_profile`` """
+        john, jane, arie = [User.objects.get(pk=pk) for pk in (1, 2, 3)]
+        Profile.objects.filter(pk=1).update(privacy='registered')
+        Profile.objects.filter(pk=2).update(privacy='closed')
+        Profile.objects.create(user=arie, privacy='closed')
+        assign_perm('view_profile', arie, Profile.objects.get(pk=2))
+        friends = Group.objects.create(name='friends')
+        jane.groups.add(friends)
+        assign_perm('view_profile', friends, Profile.objects.get(user=arie))
+
+        profiles = list(Profile.objects.order_by('pk'))
+        for user in (AnonymousUser(), john, jane, arie):
+            expected = dict((profile.pk, profile.can_view_profile(user))
+                            for profile in profiles)
+            # Only the closed profiles are checked, with one query for the
+            # permissions of the user and one for their groups.
+            with self.assertNumQueries(0 if user is john else 2):
+                self.assertEqual(bulk_can_view(user, profiles), expected)
+
+            viewable = [profile.pk for profile in profiles if expected[profile.pk]]
+            self.assertEqual([profile.pk for profile in
+                              Profile.objects.order_by('pk').viewable_by(user)],
+                             viewable)
+            rendered = Template(
+                '{% load userena_tags %}'
+                '{% for profile in profiles|viewable_by:user %}'
+                '{{ profile.pk }} {% endfor %}').render(
+                Context({'profiles': profiles, 'user': user}))
+            self.assertEqual(rendered.split(), [text_type(pk) for pk in viewable])
+
+    def test_denormalized_visibility(self):
+        """ The ``visibility`` follows the privacy and the active user """
+        anon_user = AnonymousUser()
+        reg_user = User.objects.get(pk=2)
+
+        def visible(user):
+            return sorted(Profile.objects.get_visible_profiles(user)
+                                         .values_list('pk', flat=True))
+
+        profile = Profile.objects.get(pk=1)
+        profile.privacy = 'registered'
+        profile.save()
+        expected = (visible(anon_user), visible(reg_user))
+
+        userena_settings.USERENA_DENORMALIZED_VISIBILITY = True
+        try:
+            # The fixtures have no visibility until it's filled in.
+            self.assertTrue(Profile.objects.inconsistent_visibility().exists())
+            Profile.objects.update_visibility()
+            self.assertFalse(Profile.objects.inconsistent_visibility().exists())
+            self.assertEqual((visible(anon_user), visible(reg_user)), expected)
+            self.assertNotIn('JOIN', str(
+                Profile.objects.get_visible_profiles(reg_user).query))
+            # Models without the mixin still join the users.
+            self.assertIn('JOIN', str(
+                SecondProfile.objects.get_visible_profiles(reg_user).query))
+
+            # Saving the privacy updates the visibility.
+            profile.privacy = 'closed'
+            profile.save()
+            self.assertEqual(Profile.objects.get(pk=1).visibility,
+                             Profile.VISIBILITY_HIDDEN)
+            profile.privacy = 'open'
+            profile.save(update_fields=['privacy'])
+            self.assertEqual(Profile.objects.get(pk=1).visibility,
+                             Profile.VISIBILITY_OPEN)
+
+            # So does (de)activating the user.
+            profile.user.is_active = False
+            profile.user.save()
+            self.assertNotIn(profile.pk, visible(reg_user))
+            User.objects.filter(pk=profile.user_id).update(is_active=True)
+            userena_signals.activation_complete.send(sender=None,
+                                                     user=profile.user)
+            self.assertIn(profile.pk, visible(anon_user))
+            self.assertFalse(Profile.objects.inconsistent_visibility().exists())
+        finally:
+            userena_settings.USERENA_DENORMALIZED_VISIBILITY = False
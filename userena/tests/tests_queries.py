@@ -0,0 +1,205 @@
+# encoding: utf-8
+from __future__ import unicode_literals
+
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase, RequestFactory
+from django.test.utils import override_settings
+
+from userena.contrib.umessages.models import Message, MessageContact
+from userena.compat import CaptureQueriesContext
+from userena.models import UserenaSignup
+from userena import settings as userena_settings
+from userena.utils import get_profile_model
+from userena.views import ProfileListView
+
+import os
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+User = get_user_model()
+
+
+class QueryBudgetMixin(object):
+    """
+    Pins the maximum amount of queries of a view or manager method.
+
+    Set the ``USERENA_QUERY_REPORT`` environment variable to print the
+    queries, wall time and allocated memory of every measured call.
+
+    """
+    report = []
+
+    def assertQueryBudget(self, budget, name, func, *args, **kwargs):
+        # Tracing allocations is slow, so only do it for the report.
+        trace = tracemalloc is not None and os.environ.get('USERENA_QUERY_REPORT')
+        if trace:
+            tracemalloc.start()
+        started = time.time()
+        with CaptureQueriesContext(connection) as queries:
+            result = func(*args, **kwargs)
+        elapsed = time.time() - started
+        allocated = None
+        if trace:
+            allocated = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        self.report.append((name, len(queries), elapsed, allocated))
+        self.assertTrue(len(queries) <= budget,
+                        "%s ran %d queries, the budget is %d:\n%s" % (
+                            name, len(queries), budget,
+                            '\n'.join(query['sql'] for query in queries)))
+        return result
+
+    @classmethod
+    def tearDownClass(cls):
+        super(QueryBudgetMixin, cls).tearDownClass()
+        if os.environ.get('USERENA_QUERY_REPORT') and cls.report:
+            sys.stderr.write('\n%-40s %8s %10s %12s\n' % (
+                'endpoint', 'queries', 'ms', 'peak bytes'))
+            for name, count, elapsed, allocated in cls.report:
+                sys.stderr.write('%-40s %8d %10.1f %12s\n' % (
+                    name, count, elapsed * 1000,
+                    '-' if allocated is None else allocated))
+            del cls.report[:]
+
+
+# Hashing the passwords of all seeded users with PBKDF2 takes seconds.
+@override_settings(PASSWORD_HASHERS=('django.contrib.auth.hashers.MD5PasswordHasher',))
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """ Query budgets of the views and manager methods """
+    password = 'swordfish'
+
+    def setUp(self):
+        UserenaSignup.objects.bulk_create_users(
+            ({'username': 'user%d' % i,
+              'email': 'user%d@example.com' % i,
+              'password': self.password} for i in range(30)),
+            active=True, send_email=False)
+        get_profile_model().objects.filter(
+            user__username__in=['user%d' % i for i in range(0, 30, 3)]) \
+            .update(privacy='open')
+
+        self.alice = User.objects.get(username='user0')
+        self.bob = User.objects.get(username='user1')
+        for user in User.objects.filter(username__startswith='user')[2:12]:
+            Message.objects.send_message(self.alice, [user], 'Hello')
+        for i in range(10):
+            Message.objects.send_message(self.alice, [self.bob], 'Hi %d' % i)
+            Message.objects.send_message(self.bob, [self.alice], 'Hey %d' % i)
+
+    def login(self, user):
+        self.client.login(username=user.username, password=self.password)
+
+    def test_profile_list(self):
+        self.login(self.alice)
+        userena_settings.USERENA_DISABLE_PROFILE_LIST = False
+        try:
+            response = self.assertQueryBudget(5, 'profile_list',
+                                              self.client.get,
+                                              reverse('userena_profile_list'))
+        finally:
+            userena_settings.USERENA_DISABLE_PROFILE_LIST = True
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_list_page_size(self):
+        """ The list runs the same queries for any amount of profiles """
+        userena_settings.USERENA_DISABLE_PROFILE_LIST = False
+        try:
+            counts = []
+            for paginate_by in (1, 5, 25):
+                request = RequestFactory().get('/')
+                request.user = self.alice
+                view = ProfileListView.as_view(paginate_by=paginate_by)
+                with CaptureQueriesContext(connection) as queries:
+                    response = view(request)
+                    response.render()
+                counts.append(len(queries))
+                self.assertEqual(len(response.context_data['profile_list']),
+                                 paginate_by)
+        finally:
+            userena_settings.USERENA_DISABLE_PROFILE_LIST = True
+        # A count and the page.
+        self.assertEqual(counts, [2, 2, 2])
+
+    def test_profile_list_keyset(self):
+        """ Keyset pages run a single query without a count or offset """
+        userena_settings.USERENA_DISABLE_PROFILE_LIST = False
+        userena_settings.USERENA_PROFILE_LIST_KEYSET = True
+        try:
+            request = RequestFactory().get('/')
+            request.user = self.alice
+            response = ProfileListView.as_view(paginate_by=5)(request)
+            response.render()
+
+            request = RequestFactory().get(
+                '/', {'after': response.context_data['next_after']})
+            request.user = self.alice
+            with CaptureQueriesContext(connection) as queries:
+                response = ProfileListView.as_view(paginate_by=5)(request)
+                response.render()
+        finally:
+            userena_settings.USERENA_DISABLE_PROFILE_LIST = True
+            userena_settings.USERENA_PROFILE_LIST_KEYSET = False
+
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT', queries[0]['sql'])
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+
+    def test_profile_detail(self):
+        self.login(self.alice)
+        response = self.assertQueryBudget(
+            5, 'profile_detail', self.client.get,
+            reverse('userena_profile_detail',
+                    kwargs={'username': self.bob.username}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_signin(self):
+        response = self.assertQueryBudget(0, 'signin GET', self.client.get,
+                                          reverse('userena_signin'))
+        self.assertEqual(response.status_code, 200)
+
+        response = self.assertQueryBudget(
+            13, 'signin POST', self.client.post, reverse('userena_signin'),
+            data={'identification': self.alice.email,
+                  'password': self.password})
+        self.assertEqual(response.status_code, 302)
+
+    def test_message_list(self):
+        self.login(self.alice)
+        # The unread messages of all contacts are counted at once.
+        self.assertTrue(
+            MessageContact.objects.get_contacts_for(self.alice).count() > 10)
+        response = self.assertQueryBudget(7, 'message_list',
+                                          self.client.get,
+                                          reverse('userena_umessages_list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_message_detail(self):
+        self.login(self.alice)
+        response = self.assertQueryBudget(
+            6, 'message_detail', self.client.get,
+            reverse('userena_umessages_detail',
+                    kwargs={'username': self.bob.username}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_manager_methods(self):
+        self.assertQueryBudget(
+            1, 'get_visible_profiles', list,
+            get_profile_model().objects.get_visible_profiles(self.alice))
+        signup = UserenaSignup.objects.create_user('carol', 'carol@example.com',
+                                                   self.password,
+                                                   send_email=False).userena_signup
+        self.assertQueryBudget(3, 'activate_user',
+                               UserenaSignup.objects.activate_user,
+                               signup.activation_key)
+        self.assertQueryBudget(1, 'expired_signups', list,
+                               UserenaSignup.objects.expired_signups())
+        self.assertQueryBudget(1, 'reminder_signups', list,
+                               UserenaSignup.objects.reminder_signups())
@@ -6,11 +6,16 @@ from django.contrib.auth import get_user_model
 from django.utils.six.moves.urllib_parse import urlparse, parse_qs
 
 from userena.utils import (get_gravatar, signin_redirect, get_profile_model,
-                           get_protocol, generate_sha1)
+                           get_profile_related_name, get_protocol, generate_sha1,
+                           get_user_profile, generate_key)
 from userena import settings as userena_settings
 from userena.compat import SiteProfileNotAvailable
 
 
+def fixed_key():
+    return 'a' * 40
+
+
 class UtilsTests(TestCase):
     """ Test the extra utils methods """
     fixtures = ['users']
@@ -27,6 +32,19 @@ class UtilsTests(TestCase):
         self.assertTrue(re.match('^[a-f0-9]{40}$', h2[1]))
         self.assertTrue(re.match('^[a-f0-9]{40}$', h3[1]))
 
+    def test_generate_key(self):
+        keys = set(generate_key() for i in range(1000))
+        self.assertEqual(len(keys), 1000)
+        for key in keys:
+            self.assertTrue(re.match('^[a-f0-9]{40}$', key))
+
+        # The generator can be replaced.
+        userena_settings.USERENA_KEY_GENERATOR = 'userena.tests.tests_utils.fixed_key'
+        try:
+            self.assertEqual(generate_key(), 'a' * 40)
+        finally:
+            userena_settings.USERENA_KEY_GENERATOR = 'userena.utils.random_key'
+
     def test_get_gravatar(self):
         template = 's=%(size)s&d=%(type)s'
 
@@ -84,6 +102,41 @@ class UtilsTests(TestCase):
         with self.settings(AUTH_PROFILE_MODULE=None):
             self.assertRaises(SiteProfileNotAvailable, get_profile_model)
 
+    def test_get_profile_model_cache(self):
+        """
+        The profile model and its related name are resolved once and
+        resolved again when ``AUTH_PROFILE_MODULE`` changes.
+
+        """
+        from userena import utils
+        from userena.tests.profiles.models import Profile, SecondProfile
+
+        self.assertEqual(get_profile_model(), Profile)
+        self.assertEqual(get_profile_related_name(), 'profile')
+        self.assertEqual(utils._profile_model_cache,
+                         {'model': Profile, 'related_name': 'profile'})
+
+        with self.settings(AUTH_PROFILE_MODULE='profiles.SecondProfile'):
+            self.assertEqual(get_profile_model(), SecondProfile)
+            self.assertEqual(get_profile_related_name(), 'profile_second')
+
+        self.assertEqual(get_profile_model(), Profile)
+        self.assertEqual(get_profile_related_name(), 'profile')
+
+    def test_get_user_profile_without_create(self):
+        """ ``create=False`` returns an unsaved profile instead of writing """
+        user = get_user_model().objects.get(pk=1)
+        get_profile_model().objects.filter(user=user).delete()
+
+        with self.assertNumQueries(1):
+            profile = get_user_profile(user=user, create=False)
+        self.assertIsNone(profile.pk)
+        self.assertEqual(profile.user, user)
+        self.assertEqual(profile.privacy, userena_settings.USERENA_DEFAULT_PRIVACY)
+
+        profile = get_user_profile(user=user)
+        self.assertTrue(profile.pk)
+
     def test_get_protocol(self):
         """ Test if the correct protocol is returned """
         self.assertEqual(get_protocol(), 'http')
@@ -4,12 +4,21 @@ from datetime import datetime, timedelta
 from django.contrib.auth import get_user_model
 from django.core.urlresolvers import reverse
 from django.core import mail
+from django.core.paginator import EmptyPage
 from django.contrib.auth.forms import PasswordChangeForm
-from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser
+from django.template.loader import render_to_string
+from django.test import TestCase, RequestFactory
+from django.utils.html import escape
 
 from userena import forms
 from userena import settings as userena_settings
-from userena.utils import get_user_profile
+from userena import signals as userena_signals
+from userena.models import UserenaSignup
+from userena.paginator import (CachedCountPaginator, PROFILE_COUNT_CACHE_KEY,
+                               get_profile_count_cache)
+from userena.utils import get_user_profile, get_profile_model
+from userena.views import ProfileListView
 
 User = get_user_model()
 
@@ -36,6 +45,70 @@ class UserenaViewsTests(TestCase):
         user = User.objects.get(email='alice@example.com')
         self.assertTrue(user.is_active)
 
+    def test_signed_token_activation(self):
+        """ The activation link in the email contains the signed token """
+        userena_settings.USERENA_SIGNED_TOKENS = True
+        try:
+            self.client.post(reverse('userena_signup'),
+                             data={'username': 'alice',
+                                   'email': 'alice@example.com',
+                                   'password1': 'swordfish',
+                                   'password2': 'swordfish',
+                                   'tos': 'on'})
+            user = User.objects.get(email='alice@example.com')
+            token = user.userena_signup.get_activation_key()
+            activation_url = reverse('userena_activate',
+                                     kwargs={'activation_key': token})
+            self.assertTrue(activation_url in mail.outbox[0].body)
+
+            response = self.client.get(activation_url)
+        finally:
+            userena_settings.USERENA_SIGNED_TOKENS = False
+        self.assertRedirects(response,
+                             reverse('userena_profile_detail', kwargs={'username': user.username}))
+        self.assertTrue(User.objects.get(pk=user.pk).is_active)
+
+    def test_signed_token_replay(self):
+        """
+        A used signed token neither activates again nor reissues an
+        activation, also not after it expired.
+
+        """
+        userena_settings.USERENA_SIGNED_TOKENS = True
+        userena_settings.USERENA_ACTIVATION_RETRY = True
+        try:
+            user = UserenaSignup.objects.create_user('alice',
+                                                     'alice@example.com',
+                                                     'swordfish',
+                                                     send_email=False)
+            token = user.userena_signup.get_activation_key()
+            self.client.get(reverse('userena_activate',
+                                    kwargs={'activation_key': token}))
+            self.client.logout()
+
+            user = User.objects.get(pk=user.pk)
+            user.date_joined = datetime.today() - timedelta(days=30)
+            user.save()
+            date_joined = User.objects.get(pk=user.pk).date_joined
+
+            response = self.client.get(reverse('userena_activate',
+                                               kwargs={'activation_key': token}))
+            self.assertTemplateUsed(response, 'userena/activate_fail.html')
+
+            response = self.client.get(reverse('userena_activate_retry',
+                                               kwargs={'activation_key': token}))
+            self.assertRedirects(response,
+                                 reverse('userena_activate',
+                                         kwargs={'activation_key': token}))
+        finally:
+            userena_settings.USERENA_SIGNED_TOKENS = False
+            userena_settings.USERENA_ACTIVATION_RETRY = False
+
+        self.assertEqual(User.objects.get(pk=user.pk).date_joined, date_joined)
+        self.assertEqual(UserenaSignup.objects.get(user=user).activation_key,
+                         userena_settings.USERENA_ACTIVATED)
+        self.assertEqual(len(mail.outbox), 0)
+
     def test_activation_expired_retry(self):
         """ A ``GET`` to the activation view when activation link is expired """
         # First, register an account.
@@ -403,6 +476,23 @@ class UserenaViewsTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'userena/profile_detail.html')
 
+    def test_profile_detail_view_read_only(self):
+        """ A missing profile is not created when profiles are read only """
+        john = User.objects.get(username='john')
+        get_user_profile(user=john).delete()
+        self.client.login(username='john', password='blowfish')
+
+        userena_settings.USERENA_READ_ONLY_PROFILES = True
+        try:
+            response = self.client.get(reverse('userena_profile_detail',
+                                               kwargs={'username': 'john'}))
+        finally:
+            userena_settings.USERENA_READ_ONLY_PROFILES = False
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['profile'].pk)
+        self.assertFalse(get_profile_model().objects.filter(user=john).exists())
+
     def test_profile_edit_view(self):
         """ A ``GET`` to the edit view of a users account """
         self.client.login(username='john', password='blowfish')
@@ -447,6 +537,103 @@ class UserenaViewsTests(TestCase):
         response = self.client.get(reverse('userena_profile_list'))
         self.assertEqual(response.status_code, 404)
 
+    def test_profile_list_template(self):
+        """ The list template renders mugshots without ``ProfileListView`` """
+        profile = get_profile_model().objects.get(pk=1)
+        rendered = render_to_string('userena/profile_list.html',
+                                    {'profile_list': [profile]})
+        self.assertIn('<img src="%s" />' % escape(profile.get_mugshot_url()),
+                      rendered)
+
+    def test_profile_list_keyset(self):
+        """ With ``USERENA_PROFILE_LIST_KEYSET`` pages follow the ``after`` value """
+        userena_settings.USERENA_DISABLE_PROFILE_LIST = False
+        userena_settings.USERENA_PROFILE_LIST_KEYSET = True
+        try:
+            visible = list(get_profile_model().objects.get_visible_profiles(
+                AnonymousUser()).order_by('pk').values_list('pk', flat=True))
+            seen = []
+            url = reverse('userena_profile_list')
+            while True:
+                request = RequestFactory().get(url)
+                request.user = AnonymousUser()
+                response = ProfileListView.as_view(paginate_by=1)(request)
+                response.render()
+                seen.extend(p.pk for p in response.context_data['profile_list'])
+                next_after = response.context_data['next_after']
+                if not next_after:
+                    break
+                self.assertContains(response, '?after=%s' % next_after)
+                url = '%s?after=%s' % (reverse('userena_profile_list'), next_after)
+
+            response = self.client.get(reverse('userena_profile_list'),
+                                       {'after': '!!'})
+        finally:
+            userena_settings.USERENA_DISABLE_PROFILE_LIST = True
+            userena_settings.USERENA_PROFILE_LIST_KEYSET = False
+
+        self.assertTrue(len(visible) > 1)
+        self.assertEqual(seen, visible)
+        self.assertEqual(response.status_code, 404)
+
+    def test_profile_list_count_cache(self):
+        """ The amount of profiles is cached until a profile changes """
+        userena_settings.USERENA_DISABLE_PROFILE_LIST = False
+        userena_settings.USERENA_PROFILE_LIST_COUNT_CACHE = 'default'
+        try:
+            get_profile_count_cache().clear()
+
+            def get_count():
+                request = RequestFactory().get('/')
+                request.user = AnonymousUser()
+                response = ProfileListView.as_view(paginate_by=1)(request)
+                return response.context_data['paginator'].count
+
+            visible = get_profile_model().objects.get_visible_profiles(
+                AnonymousUser()).count()
+            self.assertEqual(get_count(), visible)
+
+            # The count isn't queried while it's cached.
+            profile = get_profile_model().objects.get_visible_profiles(
+                AnonymousUser())[0]
+            profile.privacy = 'closed'
+            profile.save()
+            with self.assertNumQueries(1):
+                self.assertEqual(get_count(), visible)
+
+            # A changed profile clears the cache.
+            userena_signals.profile_change.send(sender=None, user=profile.user)
+            self.assertEqual(get_count(), visible - 1)
+
+            # Pages past a count that is too low can still be reached.
+            get_profile_count_cache().set(PROFILE_COUNT_CACHE_KEY % 'anonymous', 0)
+            paginator = CachedCountPaginator(
+                get_profile_model().objects.order_by('pk'), 1,
+                cache_key=PROFILE_COUNT_CACHE_KEY % 'anonymous')
+            self.assertEqual(paginator.num_pages, 1)
+            page = paginator.page(1)
+            self.assertTrue(page.has_next())
+            page = paginator.page(page.next_page_number())
+            self.assertEqual(len(page), 1)
+            self.assertFalse(page.has_next())
+            self.assertRaises(EmptyPage, paginator.page, 3)
+
+            # Pages past the end of a count that is too high raise
+            # ``EmptyPage`` and the count is counted again.
+            get_profile_count_cache().set(PROFILE_COUNT_CACHE_KEY % 'anonymous', 10)
+            paginator = CachedCountPaginator(
+                get_profile_model().objects.order_by('pk'), 1,
+                cache_key=PROFILE_COUNT_CACHE_KEY % 'anonymous')
+            self.assertEqual(len(paginator.page(2)), 1)
+            self.assertRaises(EmptyPage, paginator.page, 5)
+            self.assertIsNone(get_profile_count_cache().get(
+                PROFILE_COUNT_CACHE_KEY % 'anonymous'))
+            self.assertEqual(paginator.count,
+                             get_profile_model().objects.count())
+        finally:
+            userena_settings.USERENA_DISABLE_PROFILE_LIST = True
+            userena_settings.USERENA_PROFILE_LIST_COUNT_CACHE = None
+
     def test_password_reset_view_success(self):
         """ A ``POST`` to the password reset view with email that exists"""
         response = self.client.post(reverse('userena_password_reset'),
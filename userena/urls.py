@@ -56,12 +56,12 @@ urlpatterns = [
        name='userena_signup_complete'),
 
     # Activate
-    url(r'^activate/(?P<activation_key>\w+)/$',
+    url(r'^activate/(?P<activation_key>[\w:-]+)/$',
        userena_views.activate,
        name='userena_activate'),
 
     # Retry activation
-    url(r'^activate/retry/(?P<activation_key>\w+)/$',
+    url(r'^activate/retry/(?P<activation_key>[\w:-]+)/$',
         userena_views.activate_retry,
         name='userena_activate_retry'),
 
@@ -77,7 +77,7 @@ urlpatterns = [
        userena_views.direct_to_user_template,
        {'template_name': 'userena/email_confirm_complete.html'},
        name='userena_email_confirm_complete'),
-    url(r'^confirm-email/(?P<confirmation_key>\w+)/$',
+    url(r'^confirm-email/(?P<confirmation_key>[\w:-]+)/$',
        userena_views.email_confirm,
        name='userena_email_confirm'),
 
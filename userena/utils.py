@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.core import signing
 from django.utils.encoding import smart_bytes
 from django.utils.functional import allow_lazy
 from django.utils.http import urlencode
@@ -6,10 +7,12 @@ from django.utils.six import text_type
 from django.utils.text import Truncator
 
 from userena import settings as userena_settings
-from userena.compat import SiteProfileNotAvailable, get_model
+from userena.compat import SiteProfileNotAvailable, get_model, \
+    setting_changed, import_module
 
+from binascii import hexlify
 from hashlib import sha1, md5
-import random, datetime
+import datetime, os
 import warnings
 
 
@@ -50,20 +53,30 @@ def get_gravatar(email, size=80, default='identicon'):
 
     :return: The URI pointing to the Gravatar.
 
+    """
+    base_url, query = get_gravatar_parts(size, default)
+    return base_url + get_gravatar_id(email) + query
+
+def get_gravatar_parts(size=80, default='identicon'):
+    """
+    Returns the parts of a Gravatar URL before and after the hash of the
+    email address, so the URLs of many addresses share them. The arguments
+    are the same as for :func:`get_gravatar`.
+
     """
     if userena_settings.USERENA_MUGSHOT_GRAVATAR_SECURE:
         base_url = 'https://secure.gravatar.com/avatar/'
     else: base_url = '//www.gravatar.com/avatar/'
 
-    gravatar_url = '%(base_url)s%(gravatar_id)s?' % \
-            {'base_url': base_url,
-             'gravatar_id': md5(email.lower().encode('utf-8')).hexdigest()}
-
-    gravatar_url += urlencode({
+    query = '?' + urlencode({
         's': str(size),
         'd': default
     })
-    return gravatar_url
+    return base_url, query
+
+def get_gravatar_id(email):
+    """ Returns the hash identifying ``email`` at Gravatar. """
+    return md5(email.lower().encode('utf-8')).hexdigest()
 
 def signin_redirect(redirect=None, user=None):
     """
@@ -90,6 +103,42 @@ def signin_redirect(redirect=None, user=None):
                 {'username': user.username}
     else: return settings.LOGIN_REDIRECT_URL
 
+def random_key():
+    """
+    Returns 40 hexadecimal characters from ``os.urandom``, the default
+    ``USERENA_KEY_GENERATOR``.
+
+    The key holds 160 random bits. The chance that any two of ``n`` keys are
+    the same is about ``n ** 2 / 2 ** 161``, for a billion keys that is less
+    than ``1e-30``.
+
+    """
+    return hexlify(os.urandom(20)).decode('ascii')
+
+
+_key_generator_cache = {}
+
+
+def generate_key():
+    """
+    Returns a new key for activations, email confirmations and mugshot file
+    names from the function defined by ``USERENA_KEY_GENERATOR``.
+
+    The function is called without arguments and should return a string of 40
+    lowercase hexadecimal characters, which is what the activation views
+    accept.
+
+    """
+    path = userena_settings.USERENA_KEY_GENERATOR
+    try:
+        generator = _key_generator_cache[path]
+    except KeyError:
+        module_name, function_name = path.rsplit('.', 1)
+        generator = getattr(import_module(module_name), function_name)
+        _key_generator_cache[path] = generator
+    return generator()
+
+
 def generate_sha1(string, salt=None):
     """
     Generates a sha1 hash for supplied string. Doesn't need to be very secure
@@ -109,13 +158,27 @@ def generate_sha1(string, salt=None):
         string = str(string)
 
     if not salt:
-        salt = sha1(str(random.random()).encode('utf-8')).hexdigest()[:5]
+        salt = random_key()[:5]
 
     salted_bytes = (smart_bytes(salt) + smart_bytes(string))
     hash_ = sha1(salted_bytes).hexdigest()
 
     return salt, hash_
 
+# The profile model and the name of its relation to the user are resolved
+# once per process, they are needed on almost every request.
+_profile_model_cache = {}
+
+
+def clear_profile_model_cache(setting=None, **kwargs):
+    """ Clears the cache of :func:`get_profile_model` when settings change. """
+    if setting in (None, 'AUTH_PROFILE_MODULE'):
+        _profile_model_cache.clear()
+
+setting_changed.connect(clear_profile_model_cache,
+                        dispatch_uid='userena_clear_profile_model_cache')
+
+
 def get_profile_model():
     """
     Return the model class for the currently-active user profile
@@ -124,6 +187,11 @@ def get_profile_model():
     :return: The model that is used as profile.
 
     """
+    try:
+        return _profile_model_cache['model']
+    except KeyError:
+        pass
+
     if (not hasattr(settings, 'AUTH_PROFILE_MODULE')) or \
            (not settings.AUTH_PROFILE_MODULE):
         raise SiteProfileNotAvailable
@@ -135,20 +203,54 @@ def get_profile_model():
 
     if profile_mod is None:
         raise SiteProfileNotAvailable
+    _profile_model_cache['model'] = profile_mod
     return profile_mod
 
-def get_user_profile(user):
+def get_profile_related_name():
+    """
+    Return the name of the relation from the user to the profile model.
+
+    :return: String containing the related query name of the profile.
+
+    """
+    try:
+        return _profile_model_cache['related_name']
+    except KeyError:
+        pass
+
+    related_name = get_profile_model()._meta.get_field('user')\
+                                         .related_query_name()
+    _profile_model_cache['related_name'] = related_name
+    return related_name
+
+def get_user_profile(user, create=True):
+    """
+    Return the profile of ``user``.
+
+    :param user:
+        A Django :class:`User` instance.
+
+    :param create:
+        Boolean that defines if a missing profile is created in the database.
+        When ``False`` an unsaved profile with default values is returned
+        instead, so read-only requests never write. Defaults to ``True``.
+
+    :return: The profile of the user.
+
+    """
     profile_model = get_profile_model()
     try:
         profile = user.get_profile()
     except AttributeError:
-        related_name = profile_model._meta.get_field('user')\
-                                    .related_query_name()
-        profile = getattr(user, related_name, None)
+        profile = getattr(user, get_profile_related_name(), None)
     except profile_model.DoesNotExist:
         profile = None
-    if profile:
+    # An unsaved default profile can be cached on the user by an earlier call
+    # with ``create=False``.
+    if profile and profile.pk is not None:
         return profile
+    if not create:
+        return profile_model(user=user)
     return profile_model.objects.create(user=user)
 
 def get_protocol():
@@ -194,3 +296,60 @@ def get_user_model():
                   "django-userena.", DeprecationWarning)
     from django.contrib.auth import get_user_model
     return get_user_model()
+
+
+def make_signed_token(user_id, purpose, value=''):
+    """
+    Returns a token signed with ``SECRET_KEY`` that contains the id of a user,
+    the purpose of the token, an optional value and the current time.
+
+    Used instead of the stored keys when ``USERENA_SIGNED_TOKENS`` is ``True``.
+
+    :param user_id:
+        Primary key of the user.
+
+    :param purpose:
+        String, f.ex. ``activation``. A token is only valid for the purpose it
+        was made for.
+
+    :param value:
+        String that must still be valid when the token is used, f.ex. the
+        unconfirmed email address.
+
+    """
+    return signing.dumps([user_id, value], salt='userena.%s' % purpose)
+
+
+def check_signed_token(token, purpose, max_age=None):
+    """
+    Verifies a token of :func:`make_signed_token` without querying the
+    database.
+
+    :param max_age:
+        Optional amount of seconds, older tokens are invalid.
+
+    :return:
+        Tuple of the user id and the value or ``None`` when the token is
+        invalid or expired.
+
+    """
+    try:
+        user_id, value = signing.loads(token, salt='userena.%s' % purpose,
+                                       max_age=max_age)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    return user_id, value
+
+
+def setup_worker():
+    """
+    Loads the Django apps in a process of a ``multiprocessing.Pool``.
+
+    Processes that are started with ``spawn`` or ``forkserver`` import
+    everything again, so the app registry is empty until ``django.setup()``
+    is called. Kept in this module because it imports no models.
+
+    """
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
@@ -10,17 +10,21 @@ from django.contrib import messages
 from django.core.exceptions import PermissionDenied
 from django.utils.translation import ugettext as _
 from django.http import Http404, HttpResponseRedirect
+from django.utils.encoding import force_bytes, force_text
 
 from userena.forms import (SignupForm, SignupFormOnlyEmail, AuthenticationForm,
                            ChangeEmailForm, EditProfileForm)
 from userena.models import UserenaSignup
 from userena.decorators import secure_required
+from userena.paginator import CachedCountPaginator, PROFILE_COUNT_CACHE_KEY
 from userena.utils import signin_redirect, get_profile_model, get_user_profile
 from userena import signals as userena_signals
 from userena import settings as userena_settings
 
 from guardian.decorators import permission_required_or_403
 
+import base64
+import binascii
 import warnings
 
 class ExtraContextTemplateView(TemplateView):
@@ -37,12 +41,30 @@ class ExtraContextTemplateView(TemplateView):
     post = TemplateView.get
 
 class ProfileListView(ListView):
-    """ Lists all profiles """
+    """
+    Lists all profiles.
+
+    Only the columns in ``only_fields`` are loaded, together with the user of
+    every profile. Set it to ``None`` when a custom template renders other
+    fields of the profile or user, otherwise every row needs another query.
+
+    When ``USERENA_PROFILE_LIST_KEYSET`` is ``True`` the profiles are ordered
+    by primary key and the next page starts after the profile in the ``after``
+    parameter, so no count and no offset are needed. The template gets the
+    value of this parameter for the next page as ``next_after``.
+
+    With numbered pages the amount of profiles is cached in
+    ``USERENA_PROFILE_LIST_COUNT_CACHE``, separately for anonymous and
+    registered users because they see different profiles.
+
+    """
     context_object_name='profile_list'
     page=1
     paginate_by=50
     template_name=userena_settings.USERENA_PROFILE_LIST_TEMPLATE
     extra_context=None
+    only_fields=('mugshot', 'user__username', 'user__email')
+    paginator_class=CachedCountPaginator
 
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get a context
@@ -61,12 +83,55 @@ class ProfileListView(ListView):
         context['page'] = page
         context['paginate_by'] = self.paginate_by
         context['extra_context'] = self.extra_context
+        context['next_after'] = getattr(self, 'next_after', None)
+
+        # Resolve the mugshots of the page at once instead of in the template.
+        profiles = context[self.context_object_name]
+        for profile, url in zip(profiles,
+                                get_profile_model().get_mugshot_urls(profiles)):
+            profile.mugshot_url = url
 
         return context
 
+    def paginate_queryset(self, queryset, page_size):
+        if not userena_settings.USERENA_PROFILE_LIST_KEYSET:
+            return super(ProfileListView, self).paginate_queryset(queryset,
+                                                                  page_size)
+        queryset = queryset.order_by('pk')
+        after = self.request.GET.get('after')
+        if after:
+            try:
+                after = force_text(base64.urlsafe_b64decode(
+                    force_bytes(after + '=' * (-len(after) % 4))))
+                queryset = queryset.filter(pk__gt=after)
+            except (TypeError, ValueError, binascii.Error, UnicodeDecodeError):
+                raise Http404
+
+        # Fetch one profile more to know if there is a next page.
+        object_list = list(queryset[:page_size + 1])
+        self.next_after = None
+        if len(object_list) > page_size:
+            object_list = object_list[:page_size]
+            self.next_after = force_text(base64.urlsafe_b64encode(
+                force_bytes(object_list[-1].pk)).rstrip(b'='))
+        return (None, None, object_list, False)
+
+    def get_paginator(self, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True, **kwargs):
+        if self.request.user.is_authenticated():
+            kwargs['cache_key'] = PROFILE_COUNT_CACHE_KEY % 'registered'
+        else:
+            kwargs['cache_key'] = PROFILE_COUNT_CACHE_KEY % 'anonymous'
+        return self.paginator_class(queryset, per_page, orphans=orphans,
+                                    allow_empty_first_page=allow_empty_first_page,
+                                    **kwargs)
+
     def get_queryset(self):
         profile_model = get_profile_model()
-        queryset = profile_model.objects.get_visible_profiles(self.request.user).select_related()
+        queryset = profile_model.objects.get_visible_profiles(self.request.user) \
+                                        .select_related('user')
+        if self.only_fields:
+            queryset = queryset.only(*self.only_fields)
         return queryset
 
 @secure_required
@@ -344,7 +409,8 @@ def direct_to_user_template(request, username, template_name,
 
     if not extra_context: extra_context = dict()
     extra_context['viewed_user'] = user
-    extra_context['profile'] = get_user_profile(user=user)
+    extra_context['profile'] = get_user_profile(
+        user=user, create=not userena_settings.USERENA_READ_ONLY_PROFILES)
     return ExtraContextTemplateView.as_view(template_name=template_name,
                                             extra_context=extra_context)(request)
 
@@ -382,7 +448,8 @@ def disabled_account(request, username, template_name, extra_context=None):
 
     if not extra_context: extra_context = dict()
     extra_context['viewed_user'] = user
-    extra_context['profile'] = get_user_profile(user=user)
+    extra_context['profile'] = get_user_profile(
+        user=user, create=not userena_settings.USERENA_READ_ONLY_PROFILES)
     return ExtraContextTemplateView.as_view(template_name=template_name,
                                             extra_context=extra_context)(request)
 
@@ -730,7 +797,8 @@ def profile_detail(request, username,
 
     """
     user = get_object_or_404(get_user_model(), username__iexact=username)
-    profile = get_user_profile(user=user)
+    profile = get_user_profile(
+        user=user, create=not userena_settings.USERENA_READ_ONLY_PROFILES)
     if not profile.can_view_profile(request.user):
         raise PermissionDenied
     if not extra_context: extra_context = dict()